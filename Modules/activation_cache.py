@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of propagation results for the recursive engine in 'propagation'.
+
+The variables activated from a seed NK depend only on the seed and the
+finding vector, not on the conceptual scale, and 'get_context' only uses a
+handful of distinct finding vectors. The activation closure for a (seed,
+finding) pair is therefore computed once, as the activated variable indexes
+in the order 'variable_activation' first reaches them, and merged into the
+views at every scale and repeat of the seed that uses the same finding.
+
+Closures are variable indexes into one net, and arc wiring depends on the
+whole subgraph when ids collide, so a cache is bound to a single net and is
+cleared when it is used with another one, or when 'invalidate' is called
+after the graph has changed. Journeys that share network nodes share cached
+closures when they are run over one net built from their combined subgraph,
+with 'propagate_journeys_cached' (or 'batch_feature_selections' with a
+cache).
+"""
+
+from collections import OrderedDict
+import threading
+
+from causal_net import feature_view_template, selection_features
+from propagation import map_finding_to_net_arcs, propagate, merge_index
+
+
+def activation_closure(variable, net, propagation_scheme, counter=1, schema=None):
+    '''
+    Return the indexes of the variables activated from a variable for a
+    finding, unique and in the order in which 'variable_activation' merges
+    them into the views
+    '''
+    closure = []
+    seen = set()
+
+    def activate(v, count):
+        p_scheme_mapping = map_finding_to_net_arcs(propagation_scheme, net, v, count, schema)
+        activated_variables = propagate(net.variables, net.arcs, p_scheme_mapping)
+        for av in activated_variables:
+            if av.index_position not in seen:
+                seen.add(av.index_position)
+                closure.append(av.index_position)
+        for av in activated_variables:
+            if av.variable_type != 'nk':
+                activate(av, count + 1)
+
+    activate(variable, counter)
+
+    return tuple(closure)
+
+
+class ActivationCache(object):
+    '''
+    Class for a bounded LRU cache of activation closures keyed by (variable
+    index, finding vector), with hit and miss counters. Safe to share between
+    threads.
+    '''
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._closures = OrderedDict()
+        self._net = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._closures)
+
+    def invalidate(self):
+        ''' Drop all cached closures, e.g. after the underlying graph has changed '''
+        with self._lock:
+            self._closures.clear()
+            self.version += 1
+
+    def bind(self, net):
+        ''' Use the cache with a net, dropping closures cached for any other net '''
+        with self._lock:
+            if self._net is not net:
+                self._closures.clear()
+                self._net = net
+                self.version += 1
+
+    def stats(self):
+        ''' Return a dictionary of the cache size and counters '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._closures),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+                'version': self.version
+            }
+
+    def get_closure(self, variable, net, propagation_scheme):
+        '''
+        Return the activation closure for a seed variable and finding,
+        computing and caching it on a miss
+        '''
+        key = (variable.index_position, tuple(propagation_scheme))
+
+        with self._lock:
+            closure = self._closures.get(key)
+            if closure is not None:
+                self._closures.move_to_end(key)
+                self.hits += 1
+                return closure
+            self.misses += 1
+            version = self.version
+
+        closure = activation_closure(variable, net, propagation_scheme)
+
+        with self._lock:
+            # a closure computed before an invalidation is returned but not kept
+            if version == self.version:
+                self._closures[key] = closure
+                self._closures.move_to_end(key)
+                while len(self._closures) > self.max_size:
+                    self._closures.popitem(last=False)
+
+        return closure
+
+
+def cached_variable_activation(variable, net, scheme_index, propagation_scheme,
+    selection_dict, cache):
+    '''
+    Equivalent to 'variable_activation' from a seed variable, using the
+    cached activation closure for the seed and finding
+    '''
+    closure = cache.get_closure(variable, net, propagation_scheme)
+    merge_index(scheme_index, [net.variables[i] for i in closure], selection_dict)
+
+
+def propagate_context_cached(net, journey_context, selection_dict, cache):
+    '''
+    Run propagation for every NK in a journey context at all conceptual
+    scales over a net, using and filling the activation cache
+    '''
+    cache.bind(net)
+
+    for entry in journey_context['journey_context']:
+        for nk_index in net.variable_index.get(entry['id'], []):
+            nk = net.variables[nk_index]
+            for conceptual_scale in range(0, 5):
+                p_matrix = entry['context_findings'][0][conceptual_scale]
+                cached_variable_activation(nk, net, conceptual_scale, p_matrix,
+                    selection_dict, cache)
+
+    return selection_dict
+
+
+def propagate_journeys_cached(net, journey_contexts, cache):
+    '''
+    Run propagation for a batch of journey contexts over one shared net,
+    using and filling the activation cache, and return a feature selection
+    for each journey as in 'batch_propagation.propagate_journeys'. A seed
+    and finding reached by an earlier journey in the batch is a cache hit.
+    '''
+    features = selection_features(net.variables)
+    feature_selections = []
+
+    for journey_context in journey_contexts:
+        selection_dict = feature_view_template()
+        selection_dict['features'] = list(features)
+        feature_selections.append(propagate_context_cached(net, journey_context, selection_dict, cache))
+
+    return feature_selections
+
+
+# END
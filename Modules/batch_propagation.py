@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched propagation for many journeys, over one net built from the union of
+their subgraphs, so the net is built once for the batch.
+
+Journeys are run together with the vectorised engine in
+'sparse_propagation', or one after another with the activation cache in
+'activation_cache', so that seeds shared between journeys are traversed
+once per finding.
+"""
+
+import numpy as np
+
+from activation_cache import propagate_journeys_cached
+from causal_net import (VERTEX_GROUPS, construct_columnar_net, feature_view_template, merge_subgraphs,
+    selection_features)
+from journey_context import get_context
+from sparse_propagation import SparsePropagator
+from view_space import NUM_SCALES, VIEW_KEYS
+
+
+def propagate_journeys(net, journey_contexts, propagator=None):
+    '''
+    Run vectorised propagation for a batch of journey contexts over one
+    shared net, and return a feature selection for each journey. The views
+    are variable indexes into the shared net, so every selection lists the
+    shared net's variables as its features; 'journey_selection' restricts a
+    selection to one journey's own variables.
+
+    The net should be built with 'construct_columnar_net(data, label_keys=True)',
+    so that where the ids of different vertex labels collide, one journey's
+    arcs do not pick up another journey's variables.
+    '''
+    if propagator is None:
+        propagator = SparsePropagator(net)
+
+    features = selection_features(net.variables)
+    scale_masks = propagator.journey_activation(journey_contexts)
+    feature_selections = []
+
+    for j in range(len(journey_contexts)):
+        selection_dict = feature_view_template()
+        selection_dict['features'] = list(features)
+        feature_selections.append(propagator.write_views(scale_masks[j], selection_dict))
+
+    return feature_selections
+
+
+def subgraph_positions(merged, subgraphs):
+    '''
+    Return, for each of the subgraphs a merged subgraph was built from, an
+    array of the positions of its variables in a net over the merged
+    subgraph, in the order of a net built from that subgraph alone
+    '''
+    vertex_keys = [vertex_key for variable_type, vertex_key in VERTEX_GROUPS] + ['FEATURES']
+    index = {}
+    for vertex_key in vertex_keys:
+        for v in merged['vertices'][vertex_key]:
+            index[(vertex_key, v.get('type'), v['id'])] = len(index)
+
+    return [np.array([index[(vertex_key, v.get('type'), v['id'])] for vertex_key in vertex_keys
+                      for v in data['vertices'][vertex_key]], dtype=np.int64)
+            for data in subgraphs]
+
+
+def journey_selection(selection_dict, positions, sort_indexes=False):
+    '''
+    Return a feature selection over a shared net restricted to one journey's
+    variables, at the given positions in the net: the features are those
+    variables only, and the views are re-indexed to them. With sort_indexes,
+    the index lists are sorted, as with a separate run of the vectorised
+    engine.
+    '''
+    local = dict(zip(positions.tolist(), range(len(positions))))
+    journey_selection_dict = feature_view_template()
+    journey_selection_dict['features'] = [selection_dict['features'][p] for p in positions]
+
+    for scale in range(NUM_SCALES):
+        scale_key = 'scale_' + str(scale + 1)
+        view = selection_dict['views'][scale][scale_key][0]
+        journey_view = journey_selection_dict['views'][scale][scale_key][0]
+        for view_key in VIEW_KEYS:
+            indexes = [local[i] for i in view[view_key]]
+            journey_view[view_key].extend(sorted(indexes) if sort_indexes else indexes)
+
+    return journey_selection_dict
+
+
+def batch_feature_selections(graph_object, routing_results, cache=None):
+    '''
+    Return a feature selection for each of a batch of routing results,
+    querying the subgraph for each journey from a graph object
+    (geo_graph.Graph or memory_graph.MemoryGraph) and propagating over one
+    net built from their union, with arcs resolved on (label, id).
+
+    Each selection is in the form of a separate run over the journey's own
+    subgraph: its features are the journey's variables and its views index
+    them. A separate run resolves arcs on id alone, so the two only differ
+    where ids of different labels collide within one journey's subgraph.
+
+    With an ActivationCache, the journeys are run with the cached recursive
+    engine instead, so seeds shared between journeys are traversed once per
+    finding, and the indexes are in the order they are first reached.
+    '''
+    subgraphs = []
+    journey_contexts = []
+
+    for routing_result_data in routing_results:
+        route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+        subgraphs.append(graph_object.return_subgraph_from_routing_result(route))
+        journey_contexts.append(get_context(routing_result_data))
+
+    merged = merge_subgraphs(subgraphs)
+    net = construct_columnar_net(merged, label_keys=True)
+
+    if cache is not None:
+        feature_selections = propagate_journeys_cached(net, journey_contexts, cache)
+    else:
+        feature_selections = propagate_journeys(net, journey_contexts)
+
+    return [journey_selection(selection_dict, positions, sort_indexes=cache is None)
+            for selection_dict, positions in zip(feature_selections, subgraph_positions(merged, subgraphs))]
+
+
+# END
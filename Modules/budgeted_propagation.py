@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Budgeted propagation, for bounding the size of a feature selection (and the
+time taken to build it) on dense journeys.
+
+A budget caps the number of indexes of each view type (SK, SK_PLUS_ONE,
+SK_MINUS_ONE, FEATURES) at each conceptual scale. Seeds are taken in
+priority order - the journey origin and destination, then by how much of
+the net their propagation matrix opens, so that O-D and transfer nodes come
+before turns and intersections. Once a capped view at a scale is full, the
+finding positions whose arcs only lead to full views are cleared, so those
+arcs are no longer followed (e.g. ar_feature arcs once FEATURES is full),
+and seeds whose finding is then empty are not traversed at that scale.
+Optionally, features can be kept nearest first to a focus point instead of
+in seed order.
+
+The report returned alongside the selection gives, for each scale, the
+number of indexes kept and dropped for each view type and the number of
+seeds that were skipped. Indexes are only counted as dropped if they were
+reached before the arcs leading to them were cleared.
+"""
+
+import numpy as np
+
+from activation_cache import ActivationCache
+from causal_net import ARC_TYPES, ARC_VARIABLE_TYPES, feature_view_template
+from propagation_schema import DEFAULT_SCHEMA
+from view_space import NUM_SCALES, VIEW_TYPES
+
+
+def seed_priority(journey_context):
+    '''
+    Return the entries of a journey context in priority order: the first
+    and last (origin and destination) entries, then entries by the number of
+    arcs their propagation matrix opens, then in journey order
+    '''
+    entries = journey_context['journey_context']
+    last = len(entries) - 1
+
+    def priority(i):
+        opened = sum(sum(finding) for finding in entries[i]['context_findings'][0])
+        return (0 if i in (0, last) else 1, -opened, i)
+
+    return [entries[i] for i in sorted(range(len(entries)), key=priority)]
+
+
+def bit_view_keys(schema=None):
+    '''
+    Return, for each position of a finding, the set of view keys that the
+    arcs it opens can add indexes to, directly or through the arcs opened at
+    the next depth from the variables they activate
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
+    view_keys = dict(VIEW_TYPES)
+
+    def child_types(b):
+        return set(ARC_VARIABLE_TYPES[ARC_TYPES.index(t)][1] for t in schema.bit_arc_types[b])
+
+    def feeds(b):
+        keys = set(view_keys[t] for t in child_types(b) if t in view_keys)
+        for b2 in schema.bits(schema.bit_depths[b] + 1):
+            parents = set(ARC_VARIABLE_TYPES[ARC_TYPES.index(t)][0] for t in schema.bit_arc_types[b2])
+            if len(parents & child_types(b)) > 0:
+                keys |= feeds(b2)
+        return keys
+
+    return [feeds(b) for b in range(len(schema))]
+
+
+def scale_budget(budget, scale):
+    '''
+    Return the caps for a scale from a budget, which is either a dictionary
+    of view key -> cap applied at every scale, or a list of such
+    dictionaries, one per scale. View types without a cap are unbounded.
+    '''
+    if budget is None:
+        return {}
+    if isinstance(budget, dict):
+        return budget
+    return budget[scale] or {}
+
+
+def budgeted_propagation(net, journey_context, budget, selection_dict=None, focus=None, cache=None):
+    '''
+    Run propagation for a journey context over a net within a budget, and
+    return the feature selection and a report of what was truncated.
+
+    focus -> optional [lon, lat]; if given, features are kept nearest first
+        to it rather than in seed order, so every seed is traversed for them
+    cache -> optional ActivationCache, shared across calls on the same net
+    '''
+    if selection_dict is None:
+        selection_dict = feature_view_template()
+    if cache is None:
+        cache = ActivationCache()
+    cache.bind(net)
+
+    variables = net.variables
+    view_keys = dict(VIEW_TYPES)
+    feeds = bit_view_keys()
+    seeds = [(entry, nk_index) for entry in seed_priority(journey_context)
+             for nk_index in net.variable_index.get(entry['id'], [])]
+    report = {}
+
+    for scale in range(NUM_SCALES):
+        scale_key = 'scale_' + str(scale + 1)
+        view = selection_dict['views'][scale][scale_key][0]
+        caps = scale_budget(budget, scale)
+        present = dict((view_key, set(view[view_key])) for view_key in view_keys.values())
+        dropped = dict((view_key, set()) for view_key in view_keys.values())
+        candidates = []
+        skipped_seeds = 0
+
+        for entry, nk_index in seeds:
+            # clear the finding positions whose arcs only lead to full views -
+            # with a focus, features are selected after the traversal
+            full = set(k for k in view_keys.values() if k in caps and len(view[k]) >= caps[k]
+                       and not (focus is not None and k == 'FEATURES'))
+            p_matrix = [0 if feeds[b] <= full else value
+                        for b, value in enumerate(entry['context_findings'][0][scale])]
+            if not any(p_matrix):
+                skipped_seeds += 1
+                continue
+
+            closure = cache.get_closure(variables[nk_index], net, p_matrix)
+
+            for i in closure:
+                view_key = view_keys.get(variables[i].variable_type)
+                if view_key is None or i in present[view_key]:
+                    continue
+                present[view_key].add(i)
+                if focus is not None and view_key == 'FEATURES':
+                    candidates.append(i)
+                elif view_key in caps and len(view[view_key]) >= caps[view_key]:
+                    dropped[view_key].add(i)
+                else:
+                    view[view_key].append(i)
+
+        if len(candidates) > 0:
+            geometry = np.array([variables[i].vertex_object['geometry'] for i in candidates], dtype=np.float64)
+            distance = np.hypot(geometry[:, 0] - focus[0], geometry[:, 1] - focus[1])
+            order = [candidates[k] for k in np.argsort(distance, kind='stable')]
+            room = max(0, caps['FEATURES'] - len(view['FEATURES'])) if 'FEATURES' in caps else len(order)
+            view['FEATURES'].extend(order[:room])
+            dropped['FEATURES'].update(order[room:])
+
+        report[scale_key] = dict((view_key, {'kept': len(view[view_key]), 'dropped': len(dropped[view_key])})
+                                 for view_key in view_keys.values())
+        report[scale_key]['skipped_seeds'] = skipped_seeds
+
+    return selection_dict, report
+
+
+# END
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Preprocessing tool that converts the demo csv data (the edge lists and
+feature files loaded by 'Graph.csv_load') into node and relationship files in
+the header format used by the neo4j offline importer, 'neo4j-admin import'.
+
+The NK/SK/AR... ids that appear in several edge lists are written once per
+label, and duplicate edges are written once per type, so the importer does
+the work that the repeated MERGEs do in 'csv_load'. Routing node geometries
+from a geometry reference file are attached to the NK vertices, and every
+geometry is parsed up front so bad wkt strings are reported before the build.
+
+Each label has its own id space in the import files, as ids are only unique
+per label. After the import, run 'Graph.add_vertex_constraints' and add the
+vertices to the spatial layer.
+
+Usage:
+    python bulk_import.py <data dir> <output dir> [--geometry-reference <csv>]
+"""
+
+import argparse
+import csv
+import os
+
+from geo_graph import get_coords
+from graph_data import (NETWORK_LABELS, read_edges, read_features,
+    read_geometry_reference, edge_files, feature_files)
+
+
+def collect_graph(data_dir, geometry_reference=None):
+    '''
+    Read the demo csv data and return deduplicated vertices and edges:
+        vertices -> {label: {id: wkt or None}}
+        edges -> {rel type: (parent label, child label, {(parent, child, edge_id)})}
+    along with a list of (label, id) for geometries that could not be parsed
+    '''
+    vertices = dict((label, {}) for label in NETWORK_LABELS)
+    edges = {}
+    invalid_geometries = []
+
+    for path, parent_label, child_label, rel_type in edge_files(data_dir):
+        rel_edges = edges.setdefault(rel_type, (parent_label, child_label, {}))[2]
+        for edge in read_edges(path):
+            vertices[parent_label].setdefault(edge['parent'], None)
+            vertices[child_label].setdefault(edge['child'], None)
+            rel_edges.setdefault((edge['parent'], edge['child'], edge['edge_id']), None)
+
+    for path, label in feature_files(data_dir):
+        features = vertices.setdefault(label, {})
+        for id, wkt_string in read_features(path):
+            features.setdefault(id, wkt_string)
+
+    if geometry_reference is not None:
+        for id, wkt_string in read_geometry_reference(geometry_reference):
+            if id in vertices['NK']:
+                vertices['NK'][id] = wkt_string
+
+    for label in vertices:
+        for id, wkt_string in vertices[label].items():
+            if wkt_string is None:
+                continue
+            try:
+                get_coords(wkt_string)
+            except (ValueError, IndexError):
+                invalid_geometries.append((label, id))
+
+    return vertices, edges, invalid_geometries
+
+
+def write_import_files(vertices, edges, output_dir):
+    '''
+    Write one node file per label and one relationship file per type, and
+    return the 'neo4j-admin import' arguments for them
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    arguments = []
+
+    for label, label_vertices in vertices.items():
+        path = os.path.join(output_dir, 'nodes_' + label + '.csv')
+        # network ids are 64 bit integers (TOINT in csv_load), feature ids are strings
+        id_header = 'id:long' if label in NETWORK_LABELS else 'id'
+        has_wkt = any(wkt_string is not None for wkt_string in label_vertices.values())
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([':ID(' + label + ')', id_header] + (['wkt'] if has_wkt else []))
+            for id, wkt_string in label_vertices.items():
+                writer.writerow([id, id] + ([wkt_string] if has_wkt else []))
+
+        arguments.append('--nodes:' + label + '=' + path)
+
+    for rel_type, (parent_label, child_label, rel_edges) in edges.items():
+        path = os.path.join(output_dir, 'relationships_' + rel_type + '.csv')
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([':START_ID(' + parent_label + ')', ':END_ID(' + child_label + ')', 'edge_id:long'])
+            for edge in rel_edges:
+                writer.writerow(edge)
+
+        arguments.append('--relationships:' + rel_type + '=' + path)
+
+    return arguments
+
+
+def export_for_bulk_import(data_dir, output_dir, geometry_reference=None):
+    '''
+    Convert the demo csv data into bulk import files, print a summary, and
+    return the 'neo4j-admin import' command for them
+    '''
+    vertices, edges, invalid_geometries = collect_graph(data_dir, geometry_reference)
+    arguments = write_import_files(vertices, edges, output_dir)
+
+    for label, label_vertices in vertices.items():
+        print(label, ":", len(label_vertices), "vertices")
+    for rel_type, (parent_label, child_label, rel_edges) in edges.items():
+        print(rel_type, ":", len(rel_edges), "edges")
+    for label, id in invalid_geometries:
+        print("invalid geometry:", label, id)
+
+    command = 'neo4j-admin import --database=graph.db ' + ' '.join(arguments)
+    print(command)
+
+    return command
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write neo4j-admin import files from the demo csv data')
+    parser.add_argument('data_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--geometry-reference', default=None,
+                        help='routing node geometry reference file, with rows of the form (wkt, id)')
+    args = parser.parse_args()
+
+    export_for_bulk_import(args.data_dir, args.output_dir, args.geometry_reference)
+
+
+# END
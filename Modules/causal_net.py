@@ -8,6 +8,24 @@ Causal net module for demonstrating the creation of a cn instance from a
 subgraph of geographic features.
 """
 
+import numpy as np
+
+
+# variable and arc types, in the order they are created by construct_variables
+# and construct_arcs - the position of a type is its integer type code
+VARIABLE_TYPES = ('nk', 'sk', 'ar', 'sk_plus_one', 'sk_minus_one', 'feature')
+ARC_TYPES = ('nk_sk', 'nk_ar', 'nk_sk_plus_one', 'sk_sk_minus_one', 'ar_feature')
+# (parent, child) variable types of each arc type
+ARC_VARIABLE_TYPES = (('nk', 'sk'), ('nk', 'ar'), ('nk', 'sk_plus_one'), ('sk', 'sk_minus_one'),
+                      ('ar', 'feature'))
+
+# subgraph vertex and edge keys for each variable and arc type
+VERTEX_GROUPS = (('nk', 'NK'), ('sk', 'SK'), ('ar', 'AR'), ('sk_plus_one', 'SK_PLUS_ONE'),
+                 ('sk_minus_one', 'SK_MINUS_ONE'))
+EDGE_GROUPS = (('nk_sk', 'NK_SK_BOUNDS'), ('nk_ar', 'NK_AR_ACTIVATES'),
+               ('nk_sk_plus_one', 'NK_SK_PLUS_ONE_BOUNDS'),
+               ('sk_sk_minus_one', 'SK_SK_MINUS_ONE_IN_REGION'), ('ar_feature', 'CONTAINS_FEATURE'))
+
 class Variable(object):
     '''
     Class to represent a variable in a causal net, where each variable is
@@ -158,6 +176,409 @@ def construct_arcs(data):
     return arcs
 
 
+def index_variables(variables):
+    '''
+    Return a dictionary of variable id -> list of index positions. Ids are
+    only unique per vertex label, so an id can map to more than one variable.
+    '''
+    variable_index = {}
+
+    for i in range(len(variables)):
+        variable_index.setdefault(variables[i].get_id(), []).append(i)
+
+    return variable_index
+
+
+def wire_net(variables, arcs, variable_index=None):
+    '''
+    Resolve the parent and child ids of each arc to variable index positions,
+    and set the out arcs of each variable, in one pass over the arcs.
+
+    This gives the same variable_indexes and out_arcs as calling
+    'get_parent_index' and 'get_child_index' on every arc and then
+    'get_out_arcs' on every variable, without scanning the variables for each
+    arc and the arcs for each variable.
+    '''
+    if variable_index is None:
+        variable_index = index_variables(variables)
+
+    for i in range(len(arcs)):
+        arc = arcs[i]
+        arc.variable_indexes.extend(variable_index.get(arc.edge_object['parent'], []))
+        arc.variable_indexes.extend(variable_index.get(arc.edge_object['child'], []))
+        if len(arc.variable_indexes) > 0:
+            variables[arc.variable_indexes[0]].out_arcs.append(i)
+
+    return variable_index
+
+
+def gather_ranges(starts, ends):
+    '''
+    Return the concatenation of the ranges [starts[i], ends[i]) as one array,
+    along with the index i of the range each value came from
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), owners
+    range_offsets = np.cumsum(lengths) - lengths
+    values = np.arange(total, dtype=np.int64) - np.repeat(range_offsets - starts, lengths)
+
+    return values, owners
+
+
+class CausalNet(object):
+    '''
+    Class to hold a causal net as typed NumPy columns, along with compressed
+    sparse row (CSR) structures for propagation:
+
+    variable_types -> variable type code of each variable (VARIABLE_TYPES)
+    network_ids -> ids of the variables that are not features (int64)
+    feature_ids, feature_geometry, feature_vertex_types -> id, [lon, lat]
+        and vertex label of each feature variable, where feature variables
+        come after all other variables, starting at first_feature
+    arc_types, arc_edge_ids -> arc type code (ARC_TYPES) and edge id of each
+        arc
+    arc_parent, arc_child -> first variable matching the parent and child id
+        of each arc, or -1
+
+    For variable v and arc type code t, the out arcs of v with that type are
+        out_arcs[out_offsets[v * len(ARC_TYPES) + t]:out_offsets[v * len(ARC_TYPES) + t + 1]]
+    in ascending arc order, and the variables activated by arc a (its
+    variable_indexes) are
+        arc_variables[arc_offsets[a]:arc_offsets[a + 1]]
+
+    'variables' and 'arcs' are lists of Variable and Arc objects when the net
+    is built with 'construct_net', or sequences of lightweight views over the
+    columns when it is built with 'construct_columnar_net'.
+
+    Arc parent and child ids are resolved through variable_index, on id
+    alone, unless a label_index of (variable type code, id) -> positions is
+    given, in which case they are resolved to variables of the arc type's
+    parent and child variable types (ARC_VARIABLE_TYPES) only.
+    '''
+    def __init__(self, variable_types, network_ids, features, arc_types, arc_edges,
+        variable_index, variables=None, arcs=None, label_index=None):
+        n_types = len(ARC_TYPES)
+        self.variable_index = variable_index
+        self.variable_types = np.asarray(variable_types, dtype=np.uint8)
+        self.network_ids = np.asarray(network_ids, dtype=np.int64)
+        self.first_feature = len(self.network_ids)
+        self.feature_ids = np.array([f['id'] for f in features])
+        self.feature_geometry = np.array([f['geometry'] for f in features], dtype=np.float64).reshape(-1, 2)
+        self.feature_vertex_types = np.array([f['type'] for f in features])
+
+        # resolve arc parent and child ids to variable index positions
+        self.arc_types = np.asarray(arc_types, dtype=np.uint8)
+        self.arc_edge_ids = np.array([-1 if e['edge_id'] is None else e['edge_id'] for e in arc_edges], dtype=np.int64)
+        self.arc_parent = np.full(len(arc_edges), -1, dtype=np.int32)
+        self.arc_child = np.full(len(arc_edges), -1, dtype=np.int32)
+        self.arc_offsets = np.zeros(len(arc_edges) + 1, dtype=np.int64)
+        arc_variables = []
+
+        arc_variable_codes = [tuple(VARIABLE_TYPES.index(t) for t in types) for types in ARC_VARIABLE_TYPES]
+
+        for a in range(len(arc_edges)):
+            if label_index is None:
+                parents = variable_index.get(arc_edges[a]['parent'], [])
+                children = variable_index.get(arc_edges[a]['child'], [])
+            else:
+                parent_type, child_type = arc_variable_codes[self.arc_types[a]]
+                parents = label_index.get((parent_type, arc_edges[a]['parent']), [])
+                children = label_index.get((child_type, arc_edges[a]['child']), [])
+            if len(parents) > 0:
+                self.arc_parent[a] = parents[0]
+            if len(children) > 0:
+                self.arc_child[a] = children[0]
+            arc_variables.extend(parents)
+            arc_variables.extend(children)
+            self.arc_offsets[a + 1] = len(arc_variables)
+
+        self.arc_variables = np.array(arc_variables, dtype=np.int32)
+
+        # group out arcs by (owner, arc type) - the owner is the first of the
+        # arc's variables, as in 'get_out_arcs'
+        lengths = np.diff(self.arc_offsets)
+        wired = np.nonzero(lengths > 0)[0]
+        rows = self.arc_variables[self.arc_offsets[wired]].astype(np.int64) * n_types + self.arc_types[wired]
+        order = np.argsort(rows, kind='stable')
+        self.out_offsets = np.zeros(len(self.variable_types) * n_types + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.variable_types) * n_types), out=self.out_offsets[1:])
+        self.out_arcs = wired[order].astype(np.int32)
+
+        self.variables = variables if variables is not None else VariableViews(self)
+        self.arcs = arcs if arcs is not None else ArcViews(self)
+
+    @classmethod
+    def from_objects(cls, variables, arcs, variable_index=None):
+        '''
+        Build the columns for lists of Variable and Arc objects, keeping the
+        objects as the net's variables and arcs
+        '''
+        if variable_index is None:
+            variable_index = index_variables(variables)
+        variable_types = [VARIABLE_TYPES.index(v.variable_type) for v in variables]
+        network_ids = [v.get_id() for v in variables if v.variable_type != 'feature']
+        features = [v.vertex_object for v in variables if v.variable_type == 'feature']
+        arc_types = [ARC_TYPES.index(a.arc_type) for a in arcs]
+        arc_edges = [a.edge_object for a in arcs]
+
+        return cls(variable_types, network_ids, features, arc_types, arc_edges,
+            variable_index, variables, arcs)
+
+    def get_id(self, variable):
+        ''' Return the id of a variable (index position) '''
+        if variable < self.first_feature:
+            return self.network_ids[variable].item()
+        return self.feature_ids[variable - self.first_feature].item()
+
+    def get_out_arcs(self, variable, arc_type=None):
+        '''
+        Return the out arcs of a variable (index position) for an arc type
+        code, or all of its out arcs in ascending order if no type is given
+        '''
+        n_types = len(ARC_TYPES)
+        if arc_type is None:
+            return self.out_arcs[self.out_offsets[variable * n_types]:self.out_offsets[(variable + 1) * n_types]]
+        row = variable * n_types + arc_type
+        return self.out_arcs[self.out_offsets[row]:self.out_offsets[row + 1]]
+
+    def get_arc_variables(self, arc):
+        ''' Return the index positions of the variables activated by an arc '''
+        return self.arc_variables[self.arc_offsets[arc]:self.arc_offsets[arc + 1]]
+
+
+class VariableView(object):
+    '''
+    Variable-style access to one variable of a columnar CausalNet
+    '''
+    __slots__ = ('net', 'index_position')
+
+    def __init__(self, net, index_position):
+        self.net = net
+        self.index_position = index_position
+
+    @property
+    def variable_type(self):
+        return VARIABLE_TYPES[self.net.variable_types[self.index_position]]
+
+    @property
+    def out_arcs(self):
+        return self.net.get_out_arcs(self.index_position).tolist()
+
+    @property
+    def vertex_object(self):
+        if self.index_position < self.net.first_feature:
+            return {'id': self.get_id()}
+        f = self.index_position - self.net.first_feature
+        return {
+            'id': self.get_id(),
+            'geometry': self.net.feature_geometry[f].tolist(),
+            'type': self.net.feature_vertex_types[f].item()
+        }
+
+    def get_id(self):
+        ''' Return the variable's id '''
+        return self.net.get_id(self.index_position)
+
+    def get_out_arcs(self, arcs):
+        ''' Return the index position of out arcs for this variable '''
+        return self.out_arcs
+
+
+class ArcView(object):
+    '''
+    Arc-style access to one arc of a columnar CausalNet
+    '''
+    __slots__ = ('net', 'index_position')
+
+    def __init__(self, net, index_position):
+        self.net = net
+        self.index_position = index_position
+
+    @property
+    def arc_type(self):
+        return ARC_TYPES[self.net.arc_types[self.index_position]]
+
+    @property
+    def variable_indexes(self):
+        return self.net.get_arc_variables(self.index_position).tolist()
+
+    @property
+    def edge_object(self):
+        '''
+        Edge dictionary rebuilt from the columns - ids that did not resolve
+        to a variable are not kept, so they are None here
+        '''
+        a = self.index_position
+        parent = self.net.arc_parent[a]
+        child = self.net.arc_child[a]
+        return {
+            'edge_id': self.net.arc_edge_ids[a].item(),
+            'parent': self.net.get_id(parent) if parent >= 0 else None,
+            'child': self.net.get_id(child) if child >= 0 else None
+        }
+
+
+class VariableViews(object):
+    ''' Sequence of VariableView objects over a columnar CausalNet '''
+    __slots__ = ('net',)
+
+    def __init__(self, net):
+        self.net = net
+
+    def __len__(self):
+        return len(self.net.variable_types)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('variable index out of range')
+        return VariableView(self.net, int(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield VariableView(self.net, i)
+
+
+class ArcViews(object):
+    ''' Sequence of ArcView objects over a columnar CausalNet '''
+    __slots__ = ('net',)
+
+    def __init__(self, net):
+        self.net = net
+
+    def __len__(self):
+        return len(self.net.arc_types)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('arc index out of range')
+        return ArcView(self.net, int(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ArcView(self.net, i)
+
+
+def construct_net(data):
+    '''
+    Takes a dictionary representation of a graph of geographic features as
+    input and returns a CausalNet over Variable and Arc objects, with the
+    variables and arcs wired together in one pass
+    '''
+    variables = construct_variables(data)
+    arcs = construct_arcs(data)
+    variable_index = wire_net(variables, arcs)
+
+    return CausalNet.from_objects(variables, arcs, variable_index)
+
+
+def construct_columnar_net(data, label_keys=False):
+    '''
+    Takes a dictionary representation of a graph of geographic features as
+    input and returns a CausalNet held only as NumPy columns, without
+    creating Variable and Arc objects or keeping the vertex and edge
+    dictionaries. Variables and arcs are in the same order as in
+    'construct_variables' and 'construct_arcs'.
+
+    With label_keys, arcs are resolved on (vertex label, id) rather than on
+    id alone, and the variable index only holds the NK variables, which are
+    the seeds of a journey context. This is for nets over the subgraphs of
+    several journeys, where the ids of one journey's vertices can collide
+    with those of another journey's vertices of a different label.
+    '''
+    vertices = data['vertices']
+    edges = data['edges']
+
+    variable_types = []
+    network_ids = []
+    for variable_type, vertex_key in VERTEX_GROUPS:
+        variable_types.extend([VARIABLE_TYPES.index(variable_type)] * len(vertices[vertex_key]))
+        network_ids.extend(v['id'] for v in vertices[vertex_key])
+
+    features = vertices['FEATURES']
+    variable_types.extend([VARIABLE_TYPES.index('feature')] * len(features))
+
+    variable_index = {}
+    label_index = None
+    if label_keys:
+        label_index = {}
+        for i in range(len(variable_types)):
+            id = network_ids[i] if i < len(network_ids) else features[i - len(network_ids)]['id']
+            label_index.setdefault((variable_types[i], id), []).append(i)
+        variable_index = dict((id, positions) for (code, id), positions in label_index.items()
+                              if code == VARIABLE_TYPES.index('nk'))
+    else:
+        for i in range(len(network_ids)):
+            variable_index.setdefault(network_ids[i], []).append(i)
+        for i in range(len(features)):
+            variable_index.setdefault(features[i]['id'], []).append(len(network_ids) + i)
+
+    arc_types = []
+    arc_edges = []
+    for arc_type, edge_key in EDGE_GROUPS:
+        arc_types.extend([ARC_TYPES.index(arc_type)] * len(edges[edge_key]))
+        arc_edges.extend(edges[edge_key])
+
+    return CausalNet(variable_types, network_ids, features, arc_types, arc_edges, variable_index,
+        label_index=label_index)
+
+
+def merge_subgraphs(subgraphs):
+    '''
+    Return the union of several subgraph dictionaries, e.g. the subgraphs
+    for a batch of routing results, keeping the first copy of each vertex
+    and edge. Network vertices are matched on id, features on (type, id) and
+    edges on (edge_id, parent, child).
+    '''
+    merged = {'vertices': {}, 'edges': {}}
+
+    for variable_type, vertex_key in VERTEX_GROUPS + (('feature', 'FEATURES'),):
+        merged_vertices = merged['vertices'][vertex_key] = []
+        seen = set()
+        for data in subgraphs:
+            for v in data['vertices'][vertex_key]:
+                key = (v.get('type'), v['id'])
+                if key not in seen:
+                    seen.add(key)
+                    merged_vertices.append(v)
+
+    for arc_type, edge_key in EDGE_GROUPS:
+        merged_edges = merged['edges'][edge_key] = []
+        seen = set()
+        for data in subgraphs:
+            for e in data['edges'][edge_key]:
+                key = (e['edge_id'], e['parent'], e['child'])
+                if key not in seen:
+                    seen.add(key)
+                    merged_edges.append(e)
+
+    return merged
+
+
+def selection_features(variables):
+    '''
+    Return the 'features' list of a feature selection for the variables of a
+    net, with the geometry included for feature variables
+    '''
+    features = []
+
+    for v in variables:
+        if v.variable_type=='feature':
+            vertex = v.vertex_object
+            features.append({'id': vertex['id'], 'geometry': vertex['geometry'], 'type': v.variable_type})
+        else:
+            features.append({'id': v.get_id(), 'type': v.variable_type})
+
+    return features
+
+
 def feature_view_template():
     '''
     Return a template dictionary to store the features and the views in the
@@ -23,28 +23,161 @@ Read transactions:
 # link to the neo4j python driver and import the GraphDatabase object
 from neo4j import GraphDatabase
 
-import decimal
-import re
+from graph_data import EDGE_FILES, FEATURE_FILES, FEATURE_LABELS, read_edges, read_features
+from spatial_index import window_join
+
+from collections import deque
+from itertools import islice
+import json
+import os
+import time
+
+import numpy as np
 '''
-decimal module import, regex import, get_floats and get_coords for dealing with
-floats in wkt strings
+first_vertex, get_coords and get_coords_array for dealing with floats in wkt
+strings
 '''
-def get_floats(geometry_as_string):
-    for item in re.split(' |\(|\)', geometry_as_string):
-        try:
-            yield decimal.Decimal(item)
-        except decimal.InvalidOperation:
-            pass
+def first_vertex(wkt_string):
+    '''
+    Return the text of the first vertex in a wkt string, i.e. the text up to
+    the first comma inside the innermost opening bracket, e.g. '1.0 2.0' for
+    both 'POINT (1.0 2.0)' and 'MULTIPOLYGON (((1.0 2.0, ...)))'
+    '''
+    end = wkt_string.find(')')
+    if end < 0:
+        end = len(wkt_string)
+    start = wkt_string.rfind('(', 0, end) + 1
+    comma = wkt_string.find(',', start, end)
+    if comma >= 0:
+        end = comma
+
+    return wkt_string[start:end]
 
 def get_coords(wkt_string):
-    coords = []
-    v_list = list(get_floats(wkt_string))
+    '''
+    Return the [lon, lat] of a point, or of the first vertex of any other
+    simple wkt geometry
+    '''
+    v_list = first_vertex(wkt_string).split()
     v_lon = float(v_list[0])
     v_lat = float(v_list[1])
-    coords.append(v_lon)
-    coords.append(v_lat)
 
-    return coords
+    return [v_lon, v_lat]
+
+def get_coords_array(wkt_strings):
+    '''
+    Batch variant of 'get_coords' - takes a column of wkt strings and returns
+    an (n, 2) float64 array of [lon, lat] values
+    '''
+    wkt_strings = list(wkt_strings)
+    if len(wkt_strings) == 0:
+        return np.zeros((0, 2), dtype=np.float64)
+
+    vertices = [first_vertex(w).split() for w in wkt_strings]
+    if all(len(v) == 2 for v in vertices):
+        return np.array(vertices, dtype=np.float64)
+
+    # vertices with z/m values, or malformed rows, so parse each one in turn
+    # and raise as 'get_coords' does
+    return np.array([get_coords(w) for w in wkt_strings], dtype=np.float64).reshape(-1, 2)
+
+
+def subgraph_template():
+    '''
+    Return an empty subgraph dictionary of vertices and edges, in the form
+    consumed by 'construct_variables' and 'construct_arcs'
+    '''
+    subgraph_data = {}
+
+    subgraph_data['vertices'] = {}
+
+    subgraph_data['vertices']['NK'] = []
+    subgraph_data['vertices']['SK'] = []
+    subgraph_data['vertices']['AR'] = []
+    subgraph_data['vertices']['SK_PLUS_ONE'] = []
+    subgraph_data['vertices']['SK_MINUS_ONE'] = []
+    subgraph_data['vertices']['FEATURES'] = []
+
+    subgraph_data['edges'] = {}
+
+    subgraph_data['edges']['NK_SK_BOUNDS'] = []
+    subgraph_data['edges']['NK_AR_ACTIVATES'] = []
+    subgraph_data['edges']['CONTAINS_FEATURE'] = []
+    subgraph_data['edges']['SK_SK_MINUS_ONE_IN_REGION'] = []
+    subgraph_data['edges']['NK_SK_PLUS_ONE_BOUNDS'] = []
+
+    return subgraph_data
+
+
+def feature_rows(path):
+    '''
+    Yield the rows of a feature file as dictionaries of the form {id, wkt}
+    '''
+    for id, wkt_string in read_features(path):
+        yield {'id': id, 'wkt': wkt_string}
+
+
+def csv_load_statements():
+    '''
+    Return (file name, row reader, statement) triples for loading the demo
+    csv files in batches. The rows are read on the client, and each
+    statement writes one batch of them, passed as $rows.
+
+    The statements match 'csv_load', except that feature vertices are merged
+    on their id rather than created, so reloading a batch is safe. Edge
+    ids are integers, as with TOINT in 'csv_load'.
+    '''
+    statements = []
+
+    for file_name, parent_label, child_label, rel_type in EDGE_FILES:
+        statements.append((file_name, read_edges, "UNWIND $rows AS row MERGE (parent:" + parent_label + " {id: row.parent}) MERGE (child:" + child_label + " {id: row.child}) MERGE (parent)-[:" + rel_type + " {edge_id: row.edge_id}]->(child)"))
+
+    for file_name, label in FEATURE_FILES:
+        statements.append((file_name, feature_rows, "UNWIND $rows AS row MERGE (n:" + label + " {id: row.id}) ON CREATE SET n.wkt = row.wkt"))
+
+    return statements
+
+
+def join_action_regions(action_regions_and_locations, feature_ids, feature_coords, distance=0.0002):
+    '''
+    Join action region locations, in the form returned by
+    'get_action_regions_locations', with feature coordinates, using the
+    square search window of spatial.closest. Returns the distinct
+    (ar, feature id) pairs in the form returned by 'feature_search'.
+    '''
+    ar_locations = np.array([[rec[1], rec[2]] for rec in action_regions_and_locations], dtype=np.float64)
+    ar_positions, feature_positions = window_join(ar_locations, feature_coords, distance)
+
+    action_regions_and_features = {}
+    action_regions_and_features['ar_feature_edge_list'] = []
+    seen = set()
+
+    for a, f in zip(ar_positions.tolist(), feature_positions.tolist()):
+        edge = (action_regions_and_locations[a][0], feature_ids[f])
+        if edge not in seen:
+            seen.add(edge)
+            action_regions_and_features['ar_feature_edge_list'].append({
+                    'ar_source_id': edge[0],
+                    'feature_target_id': edge[1]
+                    })
+
+    return action_regions_and_features
+
+
+def save_progress(progress_path, progress):
+    '''
+    Write load progress to a json file, replacing the previous file only
+    once the new one has been written
+    '''
+    temp_path = progress_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(temp_path, progress_path)
+
+
+# vertex labels in the demo graph, as used by 'add_constraints'
+VERTEX_LABELS = ('NK', 'SK', 'AR', 'SK_PLUS_ONE', 'SK_MINUS_ONE', 'OSM_POINTS',
+                 'VML_POINTS', 'OSM_LOW_DETAIL', 'BOROUGH_TEXT')
 
 
 class Graph(object):
@@ -122,6 +255,62 @@ class Graph(object):
         return None
 
 
+    def load_data_from_csv_chunked(self, data_dir, batch_size=10000, progress_path=None):
+        '''
+        Load vertices and edges into graph in fixed-size batches, reading the
+        csv files in data_dir on the client and committing each batch in its
+        own write transaction. Each file is read once, so the cost does not
+        grow with the number of batches. The row offset is recorded per file
+        after every batch, so if a progress file is given an interrupted load
+        resumes from the last committed batch.
+
+        Returns the progress for each file, with the number of rows loaded and
+        the throughput in rows/sec for this run.
+        '''
+        progress = {}
+        if progress_path is not None and os.path.exists(progress_path):
+            with open(progress_path, 'r') as f:
+                progress = json.load(f)
+
+        with self._driver.session() as session:
+            for file_name, read_rows, statement in csv_load_statements():
+                state = progress.setdefault(file_name, {'rows': 0, 'complete': False})
+                if state['complete']:
+                    print(file_name, ": already loaded,", state['rows'], "rows")
+                    continue
+
+                start = time.time()
+                rows_this_run = 0
+                rows = iter(read_rows(os.path.join(data_dir, file_name)))
+                # skip the rows committed by a previous run
+                deque(islice(rows, state['rows']), maxlen=0)
+
+                while not state['complete']:
+                    batch = list(islice(rows, batch_size))
+                    if len(batch) > 0:
+                        session.write_transaction(self.csv_load_batch, statement, batch)
+                    state['rows'] += len(batch)
+                    rows_this_run += len(batch)
+                    state['complete'] = len(batch) < batch_size
+                    if progress_path is not None:
+                        save_progress(progress_path, progress)
+
+                seconds = time.time() - start
+                state['rows_per_sec'] = rows_this_run / seconds if seconds > 0 else 0.0
+                print(file_name, ":", rows_this_run, "rows loaded,", round(state['rows_per_sec'], 1), "rows/sec")
+
+        return progress
+
+    @staticmethod
+    def csv_load_batch(tx, statement, rows):
+        '''
+        Write one batch of rows from a csv file
+        '''
+        tx.run(statement, rows=rows)
+
+        return None
+
+
     def set_geometry(self, geometry_reference, i):
         '''
         Workaround to ensure routing nodes have a geometry property in the demo
@@ -143,6 +332,68 @@ class Graph(object):
         return None
 
 
+    def set_geometry_batched(self, geometry_pairs, labels=('NK',), batch_size=5000):
+        '''
+        Bulk alternative to 'set_geometry' - takes an iterable of (id, wkt)
+        pairs and writes them in UNWIND batches, one write transaction per
+        batch. Lookups are scoped to the given labels so that they use the
+        uniqueness constraints from 'add_constraints'.
+
+        Returns a summary with the number of rows written, the ids that were
+        not found for any of the labels, and the throughput in rows/sec.
+        '''
+        for label in labels:
+            if label not in VERTEX_LABELS:
+                raise ValueError('unknown vertex label: {}'.format(label))
+
+        summary = {'rows': 0, 'written': 0, 'not_found': [], 'seconds': 0.0}
+        start = time.time()
+        batch = []
+
+        with self._driver.session() as session:
+            for id_raw, wkt_string in geometry_pairs:
+                batch.append({'id': int(str(id_raw).strip()), 'wkt': wkt_string})
+                if len(batch) == batch_size:
+                    self._write_geometry_batch(session, batch, labels, summary)
+                    batch = []
+            if batch:
+                self._write_geometry_batch(session, batch, labels, summary)
+
+        summary['seconds'] = time.time() - start
+        summary['rows_per_sec'] = summary['rows'] / summary['seconds'] if summary['seconds'] > 0 else 0.0
+        print("geometry backfill:", summary['written'], "of", summary['rows'],
+              "rows written,", len(summary['not_found']), "ids not found,",
+              round(summary['rows_per_sec'], 1), "rows/sec")
+
+        return summary
+
+    def _write_geometry_batch(self, session, batch, labels, summary):
+        written_ids = session.write_transaction(self.set_wkt_property_batch, batch, labels)
+        summary['rows'] += len(batch)
+        summary['written'] += len(written_ids)
+        summary['not_found'].extend(row['id'] for row in batch if row['id'] not in written_ids)
+
+    @staticmethod
+    def set_wkt_property_batch(tx, rows, labels):
+        '''
+        Set wkt geometries for a batch of rows of the form {id, wkt}, trying
+        each label in turn for the ids that have not yet been matched. Returns
+        the set of ids that were written.
+        '''
+        written_ids = set()
+        remaining = rows
+
+        for label in labels:
+            if not remaining:
+                break
+            # labels can't be parameterised, they are checked against VERTEX_LABELS
+            result = tx.run("UNWIND $rows AS row MATCH (n:" + label + " {id: row.id}) SET n.wkt=row.wkt RETURN n.id", rows=remaining)
+            written_ids.update(record[0] for record in result)
+            remaining = [row for row in remaining if row['id'] not in written_ids]
+
+        return written_ids
+
+
     def get_wkt(self, id):
         '''
         Get the vertex geometry property
@@ -160,14 +411,47 @@ class Graph(object):
         result = tx.run("MATCH (n) WHERE n.id=$id RETURN n", id=id)
         g = result.graph()
         n = g.nodes
+        wkt_geometry_string = None
 
         for r in n:
-            global wkt_geometry_string
             wkt_geometry_string = r.get('wkt')
 
         return wkt_geometry_string
 
 
+    def get_wkt_many(self, ids, labels=('NK',)):
+        '''
+        Get the vertex geometries for a list of ids in a single read
+        transaction, returning a dictionary of id -> [lon, lat]. Ids that are
+        not found, or that have no geometry, are left out of the result.
+        '''
+        for label in labels:
+            if label not in VERTEX_LABELS:
+                raise ValueError('unknown vertex label: {}'.format(label))
+
+        with self._driver.session() as session:
+            res = session.read_transaction(self.get_vertex_coords, list(dict.fromkeys(ids)), labels)
+            return res
+
+    @staticmethod
+    def get_vertex_coords(tx, ids, labels):
+        '''
+        Return parsed coordinates for each id, matching on label-scoped ids
+        so that the lookup uses the uniqueness constraints
+        '''
+        coords = {}
+
+        for label in labels:
+            remaining = [id for id in ids if id not in coords]
+            if not remaining:
+                break
+            result = tx.run("UNWIND $ids AS id MATCH (n:" + label + " {id: id}) WHERE n.wkt IS NOT NULL RETURN n.id, n.wkt", ids=remaining)
+            for record in result:
+                coords[record[0]] = get_coords(record[1])
+
+        return coords
+
+
 
     def add_nodes_to_spatial_layer(self):
         '''
@@ -193,6 +477,66 @@ class Graph(object):
         return None
 
 
+    def add_nodes_to_spatial_layer_chunked(self, batch_size=10000,
+        labels=('OSM_POINTS', 'OSM_LOW_DETAIL', 'VML_POINTS', 'NK', 'BOROUGH_TEXT')):
+        '''
+        Add vertices to the spatial layer in batches of at most batch_size
+        vertices per label, committing each batch in its own write
+        transaction. Vertices that already have an RTREE_REFERENCE are
+        skipped, so an interrupted run resumes where it stopped.
+
+        Returns the number of vertices added for each label.
+        '''
+        for label in labels:
+            if label not in VERTEX_LABELS:
+                raise ValueError('unknown vertex label: {}'.format(label))
+
+        added = {}
+
+        with self._driver.session() as session:
+            session.write_transaction(self.add_wkt_layer)
+
+            for label in labels:
+                added[label] = 0
+                start = time.time()
+
+                while True:
+                    count = session.write_transaction(self.add_nodes_batch, label, batch_size)
+                    added[label] += count
+                    if count < batch_size:
+                        break
+                    print(label, ":", added[label], "vertices added to the spatial layer")
+
+                seconds = time.time() - start
+                print(label, ":", added[label], "vertices added to the spatial layer,",
+                      round(added[label] / seconds if seconds > 0 else 0.0, 1), "vertices/sec")
+
+        return added
+
+    @staticmethod
+    def add_wkt_layer(tx):
+        '''
+        Create the wkt layer if it does not already exist
+        '''
+        result = tx.run("CALL spatial.layers() YIELD name WHERE name = 'layer' RETURN count(name)")
+        if result.single()[0] == 0:
+            tx.run("CALL spatial.addWKTLayer('layer', 'wkt')")
+
+        return None
+
+    @staticmethod
+    def add_nodes_batch(tx, label, batch_size):
+        '''
+        Add up to batch_size vertices of a label that are not yet in the
+        spatial layer, returning the number of vertices added. Vertices
+        without a geometry are left out, as they can't be indexed.
+        '''
+        result = tx.run("MATCH (n:" + label + ") WHERE NOT (n)-[:RTREE_REFERENCE]-() AND n.wkt IS NOT NULL WITH n LIMIT $batch_size WITH COLLECT(n) AS nodes CALL spatial.addNodes('layer', nodes) YIELD count RETURN count", batch_size=batch_size)
+        record = result.single()
+
+        return record[0] if record is not None else 0
+
+
     '''
     Create action region subgraphs
     '''
@@ -223,11 +567,7 @@ class Graph(object):
             query_result = []
             ar_id = results[i]['ar']['id']
             temp_geometry = results[i]['nk']['wkt']
-            p = list(get_floats(temp_geometry))
-            lon_dec = p[0]
-            lat_dec = p[1]
-            lon_fl = float(lon_dec)
-            lat_fl = float(lat_dec)
+            lon_fl, lat_fl = get_coords(temp_geometry)
             query_result.append(ar_id)
             query_result.append(lon_fl)
             query_result.append(lat_fl)
@@ -281,6 +621,81 @@ class Graph(object):
         return None
 
 
+    '''
+    Create action region subgraphs in process, as one nearest-neighbour join
+    '''
+
+    def get_action_region_candidates(self):
+        '''
+        Return (label, id, wkt) for every feature vertex in the spatial layer,
+        i.e. the vertices that 'feature_search' can return
+        '''
+        with self._driver.session() as session:
+            candidates = session.read_transaction(self.get_layer_features)
+            return candidates
+
+    @staticmethod
+    def get_layer_features(tx):
+        '''
+        Return the features that have been added to the spatial layer, for
+        each feature label (all of the labels in the layer except NK)
+        '''
+        candidates = []
+
+        for label in FEATURE_LABELS:
+            result = tx.run("MATCH (n:" + label + ") WHERE (n)-[:RTREE_REFERENCE]-() RETURN n.id, n.wkt")
+            for record in result:
+                candidates.append((label, record[0], record[1]))
+
+        return candidates
+
+    def action_region_feature_join(self, distance=0.0002):
+        '''
+        Pull all action region locations and candidate feature coordinates
+        once, and join them in process. Returns the edge list in the form
+        returned by 'feature_search'.
+        '''
+        action_regions_and_locations = self.get_action_regions_locations()
+        candidates = self.get_action_region_candidates()
+        feature_ids = [id for label, id, wkt_string in candidates]
+        feature_coords = get_coords_array([wkt_string for label, id, wkt_string in candidates])
+
+        return join_action_regions(action_regions_and_locations, feature_ids, feature_coords, distance)
+
+    def create_action_region_subgraphs_batched(self, action_regions_and_features, batch_size=5000):
+        '''
+        Write CONTAINS_FEATURE edges from an edge list in the form returned by
+        'feature_search' or 'action_region_feature_join', in UNWIND batches
+        with one write transaction per batch
+        '''
+        rows = [{'source_id': edge['ar_source_id'], 'target_id': edge['feature_target_id']}
+                for edge in action_regions_and_features['ar_feature_edge_list']]
+        start = time.time()
+
+        with self._driver.session() as session:
+            for i in range(0, len(rows), batch_size):
+                session.write_transaction(self.construct_action_regions_batch, rows[i:i + batch_size])
+
+        seconds = time.time() - start
+        print("action region edges:", len(rows), "rows written,",
+              round(len(rows) / seconds if seconds > 0 else 0.0, 1), "rows/sec")
+
+        return None
+
+    @staticmethod
+    def construct_action_regions_batch(tx, rows):
+        '''
+        Create new edges in the graph for a batch of {source_id, target_id}
+        rows. As in 'construct_action_regions', every feature with the target
+        id gets an edge, so the batch is matched once per feature label to
+        keep the lookups on the id constraints.
+        '''
+        for label in FEATURE_LABELS:
+            tx.run("UNWIND $rows AS row MATCH (ar:AR { id: row.source_id }), (feature:" + label + " { id: row.target_id }) MERGE (ar)-[edge:CONTAINS_FEATURE]->(feature)", rows=rows)
+
+        return None
+
+
     def phase_zero_spatial_query(self, p_zero_region):
         ''' Return features for the journey extent '''
         with self._driver.session() as session:
@@ -382,169 +797,79 @@ class Graph(object):
 
         This data forms the basis of the Variables and Arcs in the CN
         construction functions.
-        '''
-
-        subgraph_data = {}
-
-        subgraph_data['vertices'] = {}
-
-        subgraph_data['vertices']['NK'] = []
-        subgraph_data['vertices']['SK'] = []
-        subgraph_data['vertices']['AR'] = []
-        subgraph_data['vertices']['SK_PLUS_ONE'] = []
-        subgraph_data['vertices']['SK_MINUS_ONE'] = []
-        subgraph_data['vertices']['FEATURES'] = []
-
-        subgraph_data['edges'] = {}
-
-        subgraph_data['edges']['NK_SK_BOUNDS'] = []
-        subgraph_data['edges']['NK_AR_ACTIVATES'] = []
-        subgraph_data['edges']['CONTAINS_FEATURE'] = []
-        subgraph_data['edges']['SK_SK_MINUS_ONE_IN_REGION'] = []
-        subgraph_data['edges']['NK_SK_PLUS_ONE_BOUNDS'] = []
-
-        '''
-        Graph pattern one, based on topological distance of '1' from nodes in
-        the routing result
-        '''
-        pattern_one_nk_vertices = tx.run("WITH $route AS arr MATCH pattern_one=(i)-[]->(j) WHERE i.id IN arr RETURN COLLECT(DISTINCT(i))", route=route)
-        pattern_one_child_vertices = tx.run("WITH $route AS arr MATCH pattern_one=(i)-[]->(j) WHERE i.id IN arr RETURN COLLECT(DISTINCT(j))", route=route)
-        pattern_one_paths = tx.run("WITH $route AS arr MATCH pattern_one=(i)-[]->(j) WHERE i.id IN arr RETURN relationships(pattern_one), i, j", route=route)
-        '''
-        Graph pattern two, based on topological distance of '2' from nodes in
-        the routing result
-        '''
-        pattern_two_children_of_children_vertices = tx.run("WITH $route AS arr MATCH pattern_two=(i)-[]->(j)-[]->(k) WHERE i.id IN arr RETURN COLLECT(DISTINCT(k))", route=route)
-        pattern_two_paths = tx.run("WITH $route AS arr MATCH pattern_two=(i)-[]->(j)-[]->(k) WHERE i.id IN arr RETURN relationships(pattern_two), i, j, k", route=route)
-
-
-        ''' consume vertices and add to the subgraph '''
-
-        #get data from results using types built into the neo python driver
-        res_one = pattern_one_nk_vertices.graph()
-        res_two = pattern_one_child_vertices.graph()
-        res_three = pattern_two_children_of_children_vertices.graph()
-
-        res_one_vertices = res_one.nodes
-        res_two_vertices = res_two.nodes
-        res_three_vertices = res_three.nodes
-
-        for record in res_one_vertices:
-            v_id = record['id']
-            subgraph_data['vertices']['NK'].append({'id': v_id})
-
-        for record in res_two_vertices:
-            v_id = record['id']
-            v_labels = record.labels
-            l = list(v_labels)[0]
-
-            if l == 'SK':
-                subgraph_data['vertices']['SK'].append({'id': v_id})
-
-
-            if l == 'AR':
-                subgraph_data['vertices']['AR'].append({'id': v_id})
-
-
-            if l == 'SK_PLUS_ONE':
-                subgraph_data['vertices']['SK_PLUS_ONE'].append({'id': v_id})
-
-
-        for record in res_three_vertices:
-            v_id = record['id']
-            v_labels = record.labels
-            l = list(v_labels)[0]
-
-            if l == 'SK_MINUS_ONE':
-                subgraph_data['vertices']['SK_MINUS_ONE'].append({'id': v_id})
-
-            if l == 'OSM_POINTS':
-                # get the geometry property for features in the demo
-                type = "OSM_POINTS"
-                v_geometry = get_coords(record['wkt'])
-                subgraph_data['vertices']['FEATURES'].append({'id': v_id, 'geometry': v_geometry, 'type': type})
-
-            if l == 'OSM_LOW DETAIL':
-                # get the geometry property for features in the demo
-                type = "OSM_LOW_DETAIL"
-                v_geometry = get_coords(record['wkt'])
-                subgraph_data['vertices']['FEATURES'].append({'id': v_id, 'geometry': v_geometry, 'type': type})
-
-            if l == 'VML_POINTS':
-                # get the geometry property for features in the demo
-                type = "VML_POINTS"
-                v_geometry = get_coords(record['wkt'])
-                subgraph_data['vertices']['FEATURES'].append({'id': v_id, 'geometry': v_geometry, 'type': type})
-
-
-        ''' consume edges and add to the subgraph'''
-
-        res_four = pattern_one_paths.graph()
-        res_four_edges = res_four.relationships
-
-        for r in res_four_edges:
-            rel_type = r.type
-
-            if rel_type == 'NK_SK_BOUNDS':
-                # note that 'start_node' and 'end_node' are from the neo
-                # python driver
-                start_id = r.start_node['id']
-                end_id = r.end_node['id']
-                edge_id = r.get('edge_id')
-                subgraph_data['edges']['NK_SK_BOUNDS'].append({
-                        'edge_id': edge_id,
-                        'parent': start_id,
-                        'child': end_id
-                        })
-
-
-            if rel_type == 'NK_AR_ACTIVATES':
-                start_id = r.start_node['id']
-                end_id = r.end_node['id']
-                edge_id = r.get('edge_id')
-                subgraph_data['edges']['NK_AR_ACTIVATES'].append({
-                        'edge_id': edge_id,
-                        'parent': start_id,
-                        'child': end_id
-                        })
-
-            if rel_type == 'NK_SK_PLUS_ONE_BOUNDS':
-                start_id = r.start_node['id']
-                end_id = r.end_node['id']
-                edge_id = r.get('edge_id')
-                subgraph_data['edges']['NK_SK_PLUS_ONE_BOUNDS'].append({
-                        'edge_id': edge_id,
-                        'parent': start_id,
-                        'child': end_id
-                        })
-
-
-        res_five = pattern_two_paths.graph()
-        res_five_edges = res_five.relationships
-
-        for r in res_five_edges:
-            rel_type = r.type
-
-            if rel_type == 'SK_SK_MINUS_ONE_IN_REGION':
-                start_id = r.start_node['id']
-                end_id = r.end_node['id']
-                edge_id = r.get('edge_id')
-                subgraph_data['edges']['SK_SK_MINUS_ONE_IN_REGION'].append({
-                        'edge_id': edge_id,
-                        'parent': start_id,
-                        'child': end_id
-                        })
-
-            if rel_type == 'CONTAINS_FEATURE':
-                start_id = r.start_node['id']
-                end_id = r.end_node['id']
-                edge_id = r.id
-                subgraph_data['edges']['CONTAINS_FEATURE'].append({
-                        'edge_id': edge_id,
-                        'parent': start_id,
-                        'child': end_id
-                        })
 
+        The traversal is a single query that expands once to a topological
+        distance of two - each record is one (i)-[r1]->(j) path with an
+        optional (j)-[r2]->(k) extension - and the records are streamed into
+        the dictionary in one pass, with vertices and edges deduplicated on
+        their internal ids.
+        '''
+
+        subgraph_data = subgraph_template()
+        vertices = subgraph_data['vertices']
+        edges = subgraph_data['edges']
+
+        seen_i = set()
+        seen_j = set()
+        seen_k = set()
+        seen_r1 = set()
+        seen_r2 = set()
+
+        result = tx.run("MATCH (i:NK)-[r1]->(j) WHERE i.id IN $route OPTIONAL MATCH (j)-[r2]->(k) RETURN i, r1, j, r2, k", route=route)
+
+        for record in result:
+            i, r1, j, r2, k = record[0], record[1], record[2], record[3], record[4]
+
+            ''' topological distance of '1' from nodes in the routing result '''
+            if i.id not in seen_i:
+                seen_i.add(i.id)
+                vertices['NK'].append({'id': i['id']})
+
+            if j.id not in seen_j:
+                seen_j.add(j.id)
+                l = list(j.labels)[0]
+                if l in ('SK', 'AR', 'SK_PLUS_ONE'):
+                    vertices[l].append({'id': j['id']})
+
+            if r1.id not in seen_r1:
+                seen_r1.add(r1.id)
+                if r1.type in ('NK_SK_BOUNDS', 'NK_AR_ACTIVATES', 'NK_SK_PLUS_ONE_BOUNDS'):
+                    edges[r1.type].append({
+                            'edge_id': r1.get('edge_id'),
+                            'parent': i['id'],
+                            'child': j['id']
+                            })
+
+            ''' topological distance of '2' from nodes in the routing result '''
+            if k is None:
+                continue
+
+            if k.id not in seen_k:
+                seen_k.add(k.id)
+                l = list(k.labels)[0]
+                if l == 'SK_MINUS_ONE':
+                    vertices['SK_MINUS_ONE'].append({'id': k['id']})
+                # OSM_LOW_DETAIL features are not returned as vertices, as
+                # with the earlier per-pattern queries
+                if l in ('OSM_POINTS', 'VML_POINTS'):
+                    # get the geometry property for features in the demo
+                    v_geometry = get_coords(k['wkt'])
+                    vertices['FEATURES'].append({'id': k['id'], 'geometry': v_geometry, 'type': l})
+
+            if r2.id not in seen_r2:
+                seen_r2.add(r2.id)
+                if r2.type == 'SK_SK_MINUS_ONE_IN_REGION':
+                    edges['SK_SK_MINUS_ONE_IN_REGION'].append({
+                            'edge_id': r2.get('edge_id'),
+                            'parent': j['id'],
+                            'child': k['id']
+                            })
+                if r2.type == 'CONTAINS_FEATURE':
+                    edges['CONTAINS_FEATURE'].append({
+                            'edge_id': r2.id,
+                            'parent': j['id'],
+                            'child': k['id']
+                            })
 
         # return the subgraph data expressed as a dictionary
         return subgraph_data
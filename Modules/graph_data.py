@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module describing the demo graph csv data (edge lists and feature files) and
+providing readers for it, so that the data can be used outside of the neo4j
+'LOAD CSV' statements in geo_graph.
+
+Edge lists have a header row with 'edge_id', 'parent' and 'child' columns,
+all of which are integers. Feature files have no header, and each row is of
+the form (wkt, id), where the id is kept as a string.
+"""
+
+import csv
+import os
+
+
+# (file name, parent label, child label, relationship type)
+EDGE_FILES = (
+    ('nk_sk_edges.csv', 'NK', 'SK', 'NK_SK_BOUNDS'),
+    ('nk_ar_edges.csv', 'NK', 'AR', 'NK_AR_ACTIVATES'),
+    ('nk_sk_plus_one_edges.csv', 'NK', 'SK_PLUS_ONE', 'NK_SK_PLUS_ONE_BOUNDS'),
+    ('sk_sk_minus_one_edges.csv', 'SK', 'SK_MINUS_ONE', 'SK_SK_MINUS_ONE_IN_REGION'),
+)
+
+# (file name, label)
+FEATURE_FILES = (
+    ('osm_points_example_data_v29.csv', 'OSM_POINTS'),
+    ('vml_building_text.csv', 'VML_POINTS'),
+    ('osm_name_filtered_v3.csv', 'OSM_LOW_DETAIL'),
+    ('borough_text.csv', 'BOROUGH_TEXT'),
+)
+
+NETWORK_LABELS = ('NK', 'SK', 'AR', 'SK_PLUS_ONE', 'SK_MINUS_ONE')
+FEATURE_LABELS = tuple(label for file_name, label in FEATURE_FILES)
+
+
+def read_edges(path):
+    '''
+    Yield edges from an edge list as dictionaries of the form
+    {edge_id, parent, child}
+    '''
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        for line in reader:
+            yield {
+                'edge_id': int(line['edge_id']),
+                'parent': int(line['parent']),
+                'child': int(line['child'])
+            }
+
+
+def read_features(path):
+    '''
+    Yield (id, wkt) pairs from a feature file
+    '''
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        for line in reader:
+            if len(line) < 2:
+                continue
+            yield line[1], line[0]
+
+
+def read_geometry_reference(path):
+    '''
+    Yield (id, wkt) pairs from a routing node geometry reference file, where
+    rows are of the form (wkt, id) as in 'Graph.set_wkt_property'
+    '''
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        for line in reader:
+            if len(line) < 2:
+                continue
+            yield int(line[1].strip()), line[0]
+
+
+def edge_files(data_dir):
+    '''
+    Yield (path, parent label, child label, relationship type) for each edge
+    list in the data directory
+    '''
+    for file_name, parent_label, child_label, rel_type in EDGE_FILES:
+        yield os.path.join(data_dir, file_name), parent_label, child_label, rel_type
+
+
+def feature_files(data_dir):
+    '''
+    Yield (path, label) for each feature file in the data directory
+    '''
+    for file_name, label in FEATURE_FILES:
+        yield os.path.join(data_dir, file_name), label
+
+
+# END
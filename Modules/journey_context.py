@@ -9,108 +9,167 @@ on the active attribute of each routing node, assigns a propagation matrix.
 
 Returns a dictionary of k-level routing nodes with propagation matrices
 comprised of finding vectors for each conceptual scale.
+
+The assignment is table driven: CONTEXT_RULES maps a routing node's (type,
+active) pair to a matrix id in PROPAGATION_MATRICES, and both tables can be
+loaded from a json configuration file with 'load_context_rules'. For batch
+processing, 'context_array' returns the context as one (n, 5, 4) uint8 array
+with an array of the routing node ids, and 'context_from_array' converts
+that back to the 'journey_context' dictionary.
 '''
 
-def get_context(data):
-    '''
-     Propagation matrix templates to express context as patterns of activation
-     over the net, where:
-             finding[0] -> finding value for nk_sk & nk_sk_plus_one out arcs
-             finding[1] -> finding value for nk_ar out arcs
-             finding[2] -> finding value for sk_sk_minus_one out arcs
-             finding[3] -> finding value for ar_feature out arcs
-     '''
+import json
+
+import numpy as np
+
+
+'''
+ Propagation matrix templates to express context as patterns of activation
+ over the net, where:
+         finding[0] -> finding value for nk_sk & nk_sk_plus_one out arcs
+         finding[1] -> finding value for nk_ar out arcs
+         finding[2] -> finding value for sk_sk_minus_one out arcs
+         finding[3] -> finding value for ar_feature out arcs
+'''
+PROPAGATION_MATRICES = {
     # O-D/ transfer
-    p_matrix_one = [[1,0,0,0], [1,1,0,0], [1,1,0,1], [1,1,1,1], [1,1,1,1]]
+    1: [[1,0,0,0], [1,1,0,0], [1,1,0,1], [1,1,1,1], [1,1,1,1]],
     # turn
-    p_matrix_two = [[1,0,0,0], [1,0,0,0], [1,1,0,0], [1,1,1,1], [1,1,1,1]]
+    2: [[1,0,0,0], [1,0,0,0], [1,1,0,0], [1,1,1,1], [1,1,1,1]],
     # level-transition/ crossing/ connecting
-    p_matrix_three = [[1,0,0,0], [1,0,0,0], [1,0,0,0], [1,1,1,1], [1,1,1,1]]
+    3: [[1,0,0,0], [1,0,0,0], [1,0,0,0], [1,1,1,1], [1,1,1,1]],
     # intersection
-    p_matrix_four = [[1,0,0,0], [1,0,0,0], [1,0,0,0], [1,0,0,0], [1,1,1,1]]
+    4: [[1,0,0,0], [1,0,0,0], [1,0,0,0], [1,0,0,0], [1,1,1,1]],
+}
+
+# (routing node type, active attribute) -> propagation matrix id; routing
+# nodes with any other combination are left out of the context
+CONTEXT_RULES = {
+    ('intersection', 'traverse'): 3,
+    ('intersection', 'turn'): 2,
+    ('connecting', 'traverse'): 4,
+    ('connecting', 'turn'): 3,
+    ('entrance-exit', 'traverse'): 4,
+    ('entrance-exit', 'turn'): 3,
+    ('bus', 'traverse'): 3,
+    ('bus', 'transfer'): 1,
+    ('train', 'traverse'): 3,
+    ('train', 'transfer'): 1,
+}
+
+
+def load_context_rules(path):
+    '''
+    Load context rules and propagation matrices from a json file of the form
+        {"matrices": {"1": [[1,0,0,0], ...], ...},
+         "rules": [{"type": "bus", "active": "transfer", "matrix": 1}, ...]}
+    and return them as (rules, matrices). Either key can be left out to use
+    the default table.
+    '''
+    with open(path, 'r') as f:
+        config = json.load(f)
+
+    matrices = PROPAGATION_MATRICES
+    if 'matrices' in config:
+        matrices = dict((int(k), m) for k, m in config['matrices'].items())
+
+    rules = CONTEXT_RULES
+    if 'rules' in config:
+        rules = dict(((r['type'], r['active']), int(r['matrix'])) for r in config['rules'])
+
+    for matrix_id in rules.values():
+        if matrix_id not in matrices:
+            raise ValueError('unknown propagation matrix: {}'.format(matrix_id))
+
+    return rules, matrices
+
+
+def context_matrices(matrices=None):
+    '''
+    Return a copy of the propagation matrices for one journey context, so
+    that entries with the same matrix share it but contexts do not
+    '''
+    if matrices is None:
+        matrices = PROPAGATION_MATRICES
+
+    return dict((k, [list(finding) for finding in m]) for k, m in matrices.items())
+
+
+def node_context(node, rules, p_matrices):
+    '''
+    Return the journey context entry for a routing node from the context
+    rules and a journey's copy of the matrices, or None if no rule matches
+    '''
+    matrix_id = rules.get((node['type'], node.get('active')))
+    if matrix_id is None:
+        return None
+
+    return {'id': node['id'], 'context_findings': [p_matrices[matrix_id]]}
 
 
+def get_context(data, rules=None, matrices=None):
+    '''
+    Return the journey context for a routing result, with the propagation
+    matrix for each routing node that matches a context rule
+    '''
+    if rules is None:
+        rules = CONTEXT_RULES
+    p_matrices = context_matrices(matrices)
+
     # create a dictionary for storing the context findings
     temp_context = {}
     temp_context['journey_context'] = []
 
     # get the k-level routing nodes from the routing result
-    w = data['result']['nk_routing_nodes']
-
-    for i in range(len(w)):
-        # create an array to store the list of findings
-        context_findings = []
-        id = w[i]['id']
-        # type=='intersection'
-        if w[i]['type']=='intersection':
-            if w[i]['active']=='traverse':
-                context_findings.append(p_matrix_three)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-            if w[i]['active']=='turn':
-                context_findings.append(p_matrix_two)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-        #type=='connecting'
-        if w[i]['type']=='connecting':
-            if w[i]['active']=='traverse':
-                context_findings.append(p_matrix_four)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-            if w[i]['active']=='turn':
-                context_findings.append(p_matrix_three)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-        #type=='entrance-exit'
-        if w[i]['type']=='entrance-exit':
-            if w[i]['active']=='traverse':
-                context_findings.append(p_matrix_four)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-            if w[i]['active']=='turn':
-                context_findings.append(p_matrix_three)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-        #type=='bus'
-        if w[i]['type']=='bus':
-            if w[i]['active']=='traverse':
-                context_findings.append(p_matrix_three)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-            if w[i]['active']=='transfer':
-                context_findings.append(p_matrix_one)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-        #type=='train'
-        if w[i]['type']=='train':
-            if w[i]['active']=='traverse':
-                context_findings.append(p_matrix_three)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
-            if w[i]['active']=='transfer':
-                context_findings.append(p_matrix_one)
-                temp_context['journey_context'].append({
-                        'id': id,
-                        'context_findings': context_findings
-                        })
+    for node in data['result']['nk_routing_nodes']:
+        entry = node_context(node, rules, p_matrices)
+        if entry is not None:
+            temp_context['journey_context'].append(entry)
+
+    return temp_context
+
+
+def context_array(data, rules=None, matrices=None):
+    '''
+    Return the journey context for a routing result as (ids, findings),
+    where findings is an (n, 5, 4) uint8 array of the propagation matrix for
+    each of the n routing nodes that match a context rule
+    '''
+    if rules is None:
+        rules = CONTEXT_RULES
+    if matrices is None:
+        matrices = PROPAGATION_MATRICES
+
+    matrix_ids = sorted(matrices)
+    matrix_table = np.array([matrices[k] for k in matrix_ids], dtype=np.uint8).reshape(len(matrix_ids), 5, 4)
+    rule_positions = dict((key, matrix_ids.index(matrix_id)) for key, matrix_id in rules.items())
+
+    ids = []
+    positions = []
+    for node in data['result']['nk_routing_nodes']:
+        p = rule_positions.get((node['type'], node.get('active')))
+        if p is not None:
+            ids.append(node['id'])
+            positions.append(p)
+
+    ids = np.array(ids) if len(ids) > 0 else np.zeros(0, dtype=np.int64)
+
+    return ids, matrix_table[np.array(positions, dtype=np.int64)]
+
+
+def context_from_array(ids, findings):
+    '''
+    Convert (ids, findings) from 'context_array' to the journey context
+    dictionary returned by 'get_context'
+    '''
+    temp_context = {}
+    temp_context['journey_context'] = []
+
+    for id, p_matrix in zip(np.asarray(ids).tolist(), np.asarray(findings).tolist()):
+        temp_context['journey_context'].append({
+                'id': id,
+                'context_findings': [p_matrix]
+                })
 
     return temp_context
 
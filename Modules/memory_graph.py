@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Module containing an in-memory graph that supports the same read methods as
+geo_graph.Graph without a connection to a neo4j instance.
+
+The graph is loaded from the csv edge lists and feature files in 'Data/'.
+Vertices are numbered with integers, and edges are held as compact adjacency
+arrays (compressed sparse rows over the vertex numbers), with feature
+geometries held in a spatial index, so that subgraph retrieval and spatial
+queries run in process. This makes it suitable for
+serving the read path, and as a hermetic stand-in for the database in tests
+and benchmarks.
+
+Routing node geometries and action region (CONTAINS_FEATURE) edges are not
+part of the csv data, so they can be passed in when the graph is loaded, or
+the edges can be built in process with 'build_action_region_edges'.
+"""
+
+import numpy as np
+
+from geo_graph import get_coords, get_coords_array, join_action_regions, subgraph_template
+from spatial_index import SpatialIndex
+from graph_data import (NETWORK_LABELS, FEATURE_LABELS, read_edges,
+    read_features, read_geometry_reference, edge_files, feature_files)
+
+
+REL_TYPES = ('NK_SK_BOUNDS', 'NK_AR_ACTIVATES', 'NK_SK_PLUS_ONE_BOUNDS',
+             'SK_SK_MINUS_ONE_IN_REGION', 'CONTAINS_FEATURE')
+
+
+class MemoryGraph(object):
+    '''
+    Class for creating an in-memory graph object from the demo csv data, with
+    the read methods of geo_graph.Graph
+    '''
+
+    def __init__(self, data_dir, geometry_reference=None, action_region_edges=None):
+        '''
+        data_dir -> directory containing the demo csv files
+        geometry_reference -> optional path to a routing node geometry
+            reference file, with rows of the form (wkt, id)
+        action_region_edges -> optional iterable of (ar id, feature id)
+            pairs for the CONTAINS_FEATURE edges
+        '''
+        self._labels = []
+        self._ids = []
+        self._wkt = []
+        self._index = {}
+
+        self._edge_source = []
+        self._edge_target = []
+        self._edge_type = []
+        self._edge_id = []
+
+        for path, parent_label, child_label, rel_type in edge_files(data_dir):
+            for edge in read_edges(path):
+                parent = self._add_vertex(parent_label, edge['parent'])
+                child = self._add_vertex(child_label, edge['child'])
+                self._add_edge(parent, child, rel_type, edge['edge_id'])
+
+        for path, label in feature_files(data_dir):
+            for id, wkt_string in read_features(path):
+                v = self._add_vertex(label, id)
+                self._wkt[v] = wkt_string
+
+        if geometry_reference is not None:
+            for id, wkt_string in read_geometry_reference(geometry_reference):
+                v = self._index.get(('NK', id))
+                if v is not None:
+                    self._wkt[v] = wkt_string
+
+        if action_region_edges is not None:
+            self.add_action_region_edges(action_region_edges)
+        else:
+            self._build_adjacency()
+
+        self._build_feature_arrays()
+
+    def _add_vertex(self, label, id):
+        key = (label, id)
+        v = self._index.get(key)
+        if v is None:
+            v = len(self._ids)
+            self._index[key] = v
+            self._labels.append(label)
+            self._ids.append(id)
+            self._wkt.append(None)
+        return v
+
+    def _add_edge(self, source, target, rel_type, edge_id):
+        self._edge_source.append(source)
+        self._edge_target.append(target)
+        self._edge_type.append(REL_TYPES.index(rel_type))
+        self._edge_id.append(edge_id)
+
+    def _build_adjacency(self):
+        '''
+        Build the out-edge adjacency arrays, ordered by source vertex and then
+        by load order
+        '''
+        source = np.asarray(self._edge_source, dtype=np.int64)
+        order = np.argsort(source, kind='stable')
+
+        self._out_offsets = np.zeros(len(self._ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=len(self._ids)), out=self._out_offsets[1:])
+        self._out_targets = np.asarray(self._edge_target, dtype=np.int64)[order]
+        self._out_types = np.asarray(self._edge_type, dtype=np.uint8)[order]
+        self._out_edges = order
+
+    def _build_feature_arrays(self):
+        '''
+        Build the spatial index layer for each feature label
+        '''
+        self._spatial = SpatialIndex()
+
+        vertices = dict((label, []) for label in FEATURE_LABELS)
+        for v in range(len(self._ids)):
+            if self._labels[v] in vertices:
+                vertices[self._labels[v]].append(v)
+
+        for label in FEATURE_LABELS:
+            coords = get_coords_array([self._wkt[v] for v in vertices[label]])
+            self._spatial.add_layer(label, [self._ids[v] for v in vertices[label]], coords)
+
+    def add_action_region_edges(self, action_region_edges):
+        '''
+        Add CONTAINS_FEATURE edges from (ar id, feature id) pairs. As with
+        'Graph.construct_action_regions', the feature is matched on its id
+        alone, so an edge is added for every feature vertex with that id.
+        '''
+        feature_vertices = {}
+        for (label, id), v in self._index.items():
+            if label in FEATURE_LABELS:
+                feature_vertices.setdefault(id, []).append(v)
+
+        existing = set(zip(self._edge_source, self._edge_target))
+
+        for ar_id, feature_id in action_region_edges:
+            ar = self._index.get(('AR', ar_id))
+            if ar is None:
+                continue
+            for feature in feature_vertices.get(feature_id, []):
+                if (ar, feature) not in existing:
+                    existing.add((ar, feature))
+                    self._add_edge(ar, feature, 'CONTAINS_FEATURE', len(self._edge_id))
+
+        self._build_adjacency()
+
+    def build_action_region_edges(self, distance=0.0002):
+        '''
+        Create the CONTAINS_FEATURE edges by joining the action region
+        locations with all of the feature vertices, as in
+        'Graph.action_region_feature_join'
+        '''
+        feature_ids = []
+        feature_coords = []
+        for label in FEATURE_LABELS:
+            feature_ids.extend(self._spatial.ids(label))
+            feature_coords.append(self._spatial.layer(label).coords)
+
+        action_regions_and_features = join_action_regions(self.get_action_regions_locations(),
+            feature_ids, np.concatenate(feature_coords), distance)
+        self.add_action_region_edges((edge['ar_source_id'], edge['feature_target_id'])
+            for edge in action_regions_and_features['ar_feature_edge_list'])
+
+        return action_regions_and_features
+
+    def _out(self, v):
+        ''' Return the positions of the out edges of a vertex '''
+        return range(self._out_offsets[v], self._out_offsets[v + 1])
+
+
+    def get_wkt(self, id):
+        '''
+        Get the vertex geometry property
+        '''
+        for label in NETWORK_LABELS + FEATURE_LABELS:
+            v = self._index.get((label, id))
+            if v is not None and self._wkt[v] is not None:
+                return self._wkt[v]
+
+        return None
+
+    def get_wkt_many(self, ids, labels=('NK',)):
+        '''
+        Return a dictionary of id -> [lon, lat] for the given ids, leaving out
+        ids that are not found or have no geometry
+        '''
+        coords = {}
+
+        for id in ids:
+            if id in coords:
+                continue
+            for label in labels:
+                v = self._index.get((label, id))
+                if v is not None and self._wkt[v] is not None:
+                    coords[id] = get_coords(self._wkt[v])
+                    break
+
+        return coords
+
+
+    def get_action_regions_locations(self):
+        '''
+        Return all action region vertex IDs and the location of the underlying
+        NK routing node, in the form [ar_id, lon, lat]
+        '''
+        action_regions_and_locations = []
+        rel_type = REL_TYPES.index('NK_AR_ACTIVATES')
+
+        for e in range(len(self._edge_id)):
+            if self._edge_type[e] != rel_type:
+                continue
+            nk = self._edge_source[e]
+            if self._wkt[nk] is None:
+                continue
+            lon, lat = get_coords(self._wkt[nk])
+            action_regions_and_locations.append([self._ids[self._edge_target[e]], lon, lat])
+
+        return action_regions_and_locations
+
+
+    def _bbox_query(self, label, region):
+        '''
+        Return features of the given label in the bounding box of a region in
+        the form [[x_1, y_1],[x_2, y_2]], using the spatial index layer for
+        the label
+        '''
+        return self._spatial.selection(label, self._spatial.bbox(region, label))
+
+    def phase_zero_spatial_query(self, p_zero_region):
+        ''' Return features for the journey extent '''
+        return self._bbox_query('BOROUGH_TEXT', p_zero_region)
+
+    def phase_region_spatial_query(self, region):
+        ''' Core phase region spatial query '''
+        return self._bbox_query('VML_POINTS', region)
+
+
+    def return_subgraph_from_routing_result(self, route):
+        '''
+        Return the subgraph within a topological distance of two from the
+        nodes in the routing result, in the same dictionary of vertices and
+        edges as 'Graph.return_subgraph'
+        '''
+        subgraph_data = subgraph_template()
+        vertices = subgraph_data['vertices']
+        edges = subgraph_data['edges']
+
+        seen_i = set()
+        seen_j = set()
+        seen_k = set()
+        seen_r1 = set()
+        seen_r2 = set()
+
+        for id in route:
+            i = self._index.get(('NK', id))
+            if i is None or i in seen_i or self._out_offsets[i] == self._out_offsets[i + 1]:
+                continue
+            seen_i.add(i)
+            vertices['NK'].append({'id': id})
+
+            for p in self._out(i):
+                j = self._out_targets[p]
+                if j not in seen_j:
+                    seen_j.add(j)
+                    if self._labels[j] in ('SK', 'AR', 'SK_PLUS_ONE'):
+                        vertices[self._labels[j]].append({'id': self._ids[j]})
+
+                r1 = self._out_edges[p]
+                if r1 not in seen_r1:
+                    seen_r1.add(r1)
+                    rel_type = REL_TYPES[self._out_types[p]]
+                    if rel_type in ('NK_SK_BOUNDS', 'NK_AR_ACTIVATES', 'NK_SK_PLUS_ONE_BOUNDS'):
+                        edges[rel_type].append({
+                                'edge_id': self._edge_id[r1],
+                                'parent': id,
+                                'child': self._ids[j]
+                                })
+
+                for q in self._out(j):
+                    k = self._out_targets[q]
+                    if k not in seen_k:
+                        seen_k.add(k)
+                        l = self._labels[k]
+                        if l == 'SK_MINUS_ONE':
+                            vertices['SK_MINUS_ONE'].append({'id': self._ids[k]})
+                        # OSM_LOW_DETAIL features are not returned as
+                        # vertices, as with 'Graph.return_subgraph'
+                        if l in ('OSM_POINTS', 'VML_POINTS'):
+                            v_geometry = get_coords(self._wkt[k])
+                            vertices['FEATURES'].append({'id': self._ids[k], 'geometry': v_geometry, 'type': l})
+
+                    r2 = self._out_edges[q]
+                    if r2 not in seen_r2:
+                        seen_r2.add(r2)
+                        rel_type = REL_TYPES[self._out_types[q]]
+                        if rel_type in ('SK_SK_MINUS_ONE_IN_REGION', 'CONTAINS_FEATURE'):
+                            edges[rel_type].append({
+                                    'edge_id': self._edge_id[r2],
+                                    'parent': self._ids[j],
+                                    'child': self._ids[k]
+                                    })
+
+        return subgraph_data
+
+
+# END
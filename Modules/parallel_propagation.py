@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel runner for propagation across the (seed, conceptual scale) work
+items of a journey.
+
+The variables activated from a seed NK at a scale depend only on the seed
+and its finding at that scale, so the work items are reduced to distinct
+(seed variable, finding) pairs and their activation closures are computed
+in a thread or process pool. The closures are then merged into the views in
+the order of the serial driver loop (journey context entry, seed, scale), so
+the result is identical to a serial run of 'variable_activation', including
+the order of the indexes.
+
+Process workers build their own copy of the net from the subgraph data once,
+when the pool starts, rather than receiving it with each work item.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import time
+
+from activation_cache import activation_closure
+from causal_net import construct_columnar_net, feature_view_template
+from propagation import merge_index
+from view_space import NUM_SCALES
+
+
+# net held by each process worker, set by the pool initializer
+_worker_net = None
+
+
+def _init_worker(data):
+    global _worker_net
+    _worker_net = construct_columnar_net(data)
+
+
+def _worker_closure(key):
+    nk_index, finding = key
+    return activation_closure(_worker_net.variables[nk_index], _worker_net, finding)
+
+
+def work_items(net, journey_context):
+    '''
+    Return the (seed variable index, conceptual scale, finding) work items of
+    a journey context in the order of the serial driver loop
+    '''
+    items = []
+
+    for entry in journey_context['journey_context']:
+        for nk_index in net.variable_index.get(entry['id'], []):
+            for conceptual_scale in range(NUM_SCALES):
+                finding = tuple(entry['context_findings'][0][conceptual_scale])
+                items.append((nk_index, conceptual_scale, finding))
+
+    return items
+
+
+def parallel_propagation(data, journey_context, workers=None, executor='process',
+    selection_dict=None, net=None):
+    '''
+    Run propagation for a journey context with a pool of workers, and return
+    the feature selection with its views filled in.
+
+    data -> subgraph dictionary the net is built from
+    workers -> number of workers, defaulting to the number of cores
+    executor -> 'process' or 'thread'
+    net -> optional net already built from data with 'construct_columnar_net'
+    '''
+    if selection_dict is None:
+        selection_dict = feature_view_template()
+    if net is None:
+        net = construct_columnar_net(data)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    items = work_items(net, journey_context)
+    keys = list(dict.fromkeys((nk_index, finding) for nk_index, conceptual_scale, finding in items))
+    chunksize = max(1, len(keys) // (workers * 4))
+
+    if executor == 'process':
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+            closures = dict(zip(keys, pool.map(_worker_closure, keys, chunksize=chunksize)))
+    elif executor == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            closures = dict(zip(keys, pool.map(
+                lambda key: activation_closure(net.variables[key[0]], net, key[1]), keys)))
+    else:
+        raise ValueError("executor must be 'process' or 'thread'")
+
+    # merge in the serial order so the views match a serial run
+    for nk_index, conceptual_scale, finding in items:
+        closure = closures[(nk_index, finding)]
+        merge_index(conceptual_scale, [net.variables[i] for i in closure], selection_dict)
+
+    return selection_dict
+
+
+def benchmark_parallel(data, journey_context, worker_counts=None, executor='process'):
+    '''
+    Time the parallel runner for a range of worker counts, up to the number
+    of cores, print the speedup of each over one worker, and return a list
+    of (workers, seconds, speedup)
+    '''
+    cores = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted(set([1, 2, 4, 8, 16, cores]))
+        worker_counts = [w for w in worker_counts if w <= cores]
+
+    net = construct_columnar_net(data)
+    results = []
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        parallel_propagation(data, journey_context, workers, executor, net=net)
+        seconds = time.perf_counter() - start
+        speedup = results[0][1] / seconds if results else 1.0
+        results.append((workers, seconds, speedup))
+        print("workers:", workers, "of", cores, "cores", "time:", round(seconds, 4), "s", "speedup:", round(speedup, 2))
+
+    return results
+
+
+# END
@@ -6,6 +6,10 @@ Created: 2019
 
 phase region module to calculate the bounding boxes of spatial regions as a
 basis for spatial queries on a graph database
+
+The '_batch' functions take an (n, 2, 2) array of region endpoints, in the
+form [[x_1, y_1],[x_2, y_2]] per region, and give the same values as the
+functions for a single region.
 """
 
 import numpy as np
@@ -66,4 +70,61 @@ def get_region_bbox(size, midpoint):
     return vw
 
 
+def get_vectors_from_wkt_batch(wgs84_regions):
+    '''
+    Return an (n, 2, 2) array of region endpoints ordered as in
+    'get_vectors_from_wkt', so that each region is (v, w) with x_1 < x_2, and
+    regions with equal x values swapped
+    '''
+    regions = np.asarray(wgs84_regions).astype(np.float64).reshape(-1, 2, 2)
+    keep = regions[:, 0, 0] < regions[:, 1, 0]
+
+    return np.where(keep[:, None, None], regions, regions[:, ::-1, :])
+
+
+def euclidean_distance_batch(v, w):
+    ''' Return the distance between each pair of rows of two (n, 2) arrays '''
+    v = np.asarray(v, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    return np.sqrt(sqr(v[:, 0] - w[:, 0]) + sqr(v[:, 1] - w[:, 1]))
+
+
+def midpoint_batch(v, w):
+    ''' Return an (n, 2) array of the midpoint of each pair of rows '''
+    v = np.asarray(v, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    return np.stack(((v[:, 0] + w[:, 0]) / 2, (v[:, 1] + w[:, 1]) / 2), axis=1)
+
+
+def get_region_bbox_batch(size, midpoints):
+    '''
+    Return an (n, 2, 2) array of the bounding box of each region, laid out as
+    in 'get_region_bbox', including its lat ordering (the lower left corner
+    takes the larger lat)
+    '''
+    size = np.asarray(size, dtype=np.float64)
+    midpoints = np.asarray(midpoints, dtype=np.float64).reshape(-1, 2)
+
+    lat_upper_right = midpoints[:, 1] - (size / 2)
+    lon_upper_right = midpoints[:, 0] + (size / 2)
+    lat_lower_left = midpoints[:, 1] + (size / 2)
+    lon_lower_left = midpoints[:, 0] - (size / 2)
+
+    return np.stack((np.stack((lon_lower_left, lat_lower_left), axis=1),
+                     np.stack((lon_upper_right, lat_upper_right), axis=1)), axis=1)
+
+
+def get_region_bboxes(wgs84_regions):
+    '''
+    Return the ordered endpoints, distances, midpoints and bounding boxes for
+    an (n, 2, 2) array of region endpoints
+    '''
+    vecs = get_vectors_from_wkt_batch(wgs84_regions)
+    e_dist = euclidean_distance_batch(vecs[:, 0], vecs[:, 1])
+    mid = midpoint_batch(vecs[:, 0], vecs[:, 1])
+    vw = get_region_bbox_batch(e_dist, mid)
+
+    return vecs, e_dist, mid, vw
+
+
 # END
@@ -9,10 +9,58 @@ for automatically constructing data to support a context-dependent
 interactive multiscale information space, i.e. the presenece of features in the
 overall selection, and the peristence of those features across spatial scales
 (zoom interactions).
+
+Tracing is opt-in: pass a TraceRecorder as 'trace' to record each activation
+in memory rather than printing it.
 """
 
+import json
+
+from propagation_schema import DEFAULT_SCHEMA
+
+
+TRACE_FIELDS = ('seed', 'scale', 'depth', 'arc', 'variable')
+
+
+class TraceRecorder(object):
+    '''
+    Class to record propagation events in an in-memory buffer for debugging.
+    Each event is an activated variable, in the form (seed NK id, conceptual
+    scale, variable depth, arc index, variable index). When max_events is set,
+    events past the limit are counted but not kept.
+    '''
+
+    def __init__(self, max_events=None):
+        self.events = []
+        self.max_events = max_events
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, seed, scale, depth, arc, variable):
+        if self.max_events is not None and len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append((seed, scale, depth, arc, variable))
+
+    def clear(self):
+        self.events = []
+        self.dropped = 0
+
+    def to_list(self):
+        ''' Return the events as a list of dictionaries '''
+        return [dict(zip(TRACE_FIELDS, event)) for event in self.events]
+
+    def export(self, path):
+        ''' Write the events to a file as json lines '''
+        with open(path, 'w') as f:
+            for event in self.to_list():
+                f.write(json.dumps(event) + '\n')
+
+
 def variable_activation(variable, variables, arcs, scheme_index,
-    propagation_scheme, selection_dict, counter):
+    propagation_scheme, selection_dict, counter, trace=None, seed=None, schema=None):
     '''
     Main function to run propagation over the net, starting at k-level routing
     node variables ('NK') using the propagation scheme for the current
@@ -20,71 +68,176 @@ def variable_activation(variable, variables, arcs, scheme_index,
 
     The scheme index is the conceptual scale, and the propagation scheme is the
     finding for the parent NK variable for the activation trace at that scale.
+    The schema maps the finding to the arc types it opens (see
+    'propagation_schema'), defaulting to the schema in 'get_context'.
+    If a TraceRecorder is passed as trace, each activation is recorded against
+    the seed, which defaults to the id of the first variable.
+
+    Out arcs are filtered by type from each variable's out_arcs; see
+    'net_activation' to look them up in a CausalNet's out arc buckets.
     '''
-    # get the variable's out arcs
-    activated_variables = []
-    out_arcs = variable.out_arcs
-    print('newly activated variable id:', variable.get_id())
-    print('newly activated variable type: ', variable.variable_type)
-    print('newly activated variable out arcs: ', out_arcs)
+    if schema is None:
+        schema = DEFAULT_SCHEMA
+
+    def out_arcs(v, count):
+        return map_finding_to_arcs(propagation_scheme, arcs, v.out_arcs, count, schema)
+
+    _activate(variable, variables, arcs, scheme_index, selection_dict, counter, trace, seed, out_arcs)
+
+
+def net_activation(variable, net, scheme_index, propagation_scheme,
+    selection_dict, counter=1, trace=None, seed=None, schema=None):
+    '''
+    Equivalent to 'variable_activation' over a CausalNet from 'construct_net'
+    or 'construct_columnar_net', with the out arcs of each type looked up in
+    the net's out arc buckets
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
+
+    def out_arcs(v, count):
+        return map_finding_to_net_arcs(propagation_scheme, net, v, count, schema)
+
+    _activate(variable, net.variables, net.arcs, scheme_index, selection_dict, counter, trace, seed, out_arcs)
+
+
+def _activate(variable, variables, arcs, scheme_index, selection_dict, counter, trace, seed, out_arcs):
+    if trace is not None and seed is None:
+        seed = variable.get_id()
+
     # return a list of out arcs that are in paths in the current trace
-    print('finding: ',propagation_scheme)
-    p_scheme_mapping = map_finding_to_arcs(propagation_scheme, arcs, out_arcs, counter)
+    p_scheme_mapping = out_arcs(variable, counter)
     # return activated child variables on the filtered set of out arcs
     activated_variables = propagate(variables, arcs, p_scheme_mapping)
+
+    if trace is not None:
+        for a in p_scheme_mapping:
+            for v in arcs[a].variable_indexes:
+                trace.record(seed, scheme_index, counter, a, v)
+
     # merge the variables with the current index based on feature type,
     # ...and add the indexes to the view space data
-    for av in activated_variables:
-        print("activated variable: ", av.get_id())
-
     merge_index(scheme_index, activated_variables, selection_dict)
 
     count = counter + 1
     # for each newly activated variable, recursively call variable_activation
-    if len(activated_variables)==0:
-        print('count of activated variables:', len(activated_variables))
-
     if len(activated_variables) > 0:
         for v in activated_variables:
             if v.variable_type != 'nk':
-                variable_activation(v, variables, arcs, scheme_index,
-                    propagation_scheme, selection_dict, count)
+                _activate(v, variables, arcs, scheme_index, selection_dict, count, trace, seed, out_arcs)
+
+
+def context_activation(net, journey_context, selection_dict, trace=None, schema=None):
+    '''
+    Run 'net_activation' for every NK in a journey context, in the form
+    returned by 'get_context', at all conceptual scales, and return the
+    feature selection with its views filled in. Each call only writes to its
+    own selection_dict and trace, so journeys can be run concurrently over
+    the same net.
+    '''
+    for entry in journey_context['journey_context']:
+        for nk_index in net.variable_index.get(entry['id'], []):
+            nk = net.variables[nk_index]
+            for conceptual_scale in range(0, 5):
+                p_matrix = entry['context_findings'][0][conceptual_scale]
+                net_activation(nk, net, conceptual_scale, p_matrix, selection_dict, 1,
+                    trace, schema=schema)
+
+    return selection_dict
+
+
+def variable_activation_iterative(variable, variables, arcs, scheme_index,
+    propagation_scheme, selection_dict, counter=1, trace=None, seed=None, schema=None):
+    '''
+    Traversal mode of 'variable_activation' for one seed variable at one
+    conceptual scale, using an explicit stack instead of recursion and a
+    visited set of arcs so that each reachable arc is followed once.
+
+    The filter applied to an arc depends only on its type, so an arc that has
+    already been followed would activate variables that are already in the
+    views, and the views are the same as with 'variable_activation',
+    including the order of the indexes. The visited set also bounds the
+    traversal if the subgraph has cycles.
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
+
+    def out_arcs(v, count):
+        return map_finding_to_arcs(propagation_scheme, arcs, v.out_arcs, count, schema)
+
+    _activate_iterative(variable, variables, arcs, scheme_index, selection_dict, counter, trace, seed, out_arcs)
+
+
+def net_activation_iterative(variable, net, scheme_index, propagation_scheme,
+    selection_dict, counter=1, trace=None, seed=None, schema=None):
+    '''
+    Equivalent to 'variable_activation_iterative' over a CausalNet, with the
+    out arcs of each type looked up in the net's out arc buckets
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
+
+    def out_arcs(v, count):
+        return map_finding_to_net_arcs(propagation_scheme, net, v, count, schema)
+
+    _activate_iterative(variable, net.variables, net.arcs, scheme_index, selection_dict, counter, trace, seed,
+        out_arcs)
+
+
+def _activate_iterative(variable, variables, arcs, scheme_index, selection_dict, counter, trace, seed, out_arcs):
+    if trace is not None and seed is None:
+        seed = variable.get_id()
+
+    visited_arcs = set()
+    stack = [(variable, counter)]
+
+    while stack:
+        v, count = stack.pop()
+        p_scheme_mapping = [a for a in out_arcs(v, count) if a not in visited_arcs]
+        if len(p_scheme_mapping) == 0:
+            continue
+        visited_arcs.update(p_scheme_mapping)
+
+        activated_variables = propagate(variables, arcs, p_scheme_mapping)
 
+        if trace is not None:
+            for a in p_scheme_mapping:
+                for i in arcs[a].variable_indexes:
+                    trace.record(seed, scheme_index, count, a, i)
 
-def map_finding_to_arcs(propagation_scheme, arcs, out_arcs, counter):
+        merge_index(scheme_index, activated_variables, selection_dict)
+
+        # push in reverse so children are expanded in the order of the recursion
+        for av in reversed(activated_variables):
+            if av.variable_type != 'nk':
+                stack.append((av, count + 1))
+
+
+def map_finding_to_arcs(propagation_scheme, arcs, out_arcs, counter, schema=None):
     '''
     Return a list of out arcs that are in paths in the current trace, using the
     counter as a way of expressing the reduction in the length of the finding
     at each level of Variable depth in the net (max topological distance of
-    two in this case).
-    '''
-    active_paths = []
+    two with the default schema).
 
-    if counter==1:
-        if propagation_scheme[0]==1:
-            for a in out_arcs:
-                if arcs[a].arc_type=='nk_sk':
-                    active_paths.append(a)
-                if arcs[a].arc_type=='nk_sk_plus_one':
-                    active_paths.append(a)
+    The schema maps each position of the finding to a variable depth and the
+    arc types it opens (see 'propagation_schema').
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
 
-        if propagation_scheme[1]==1:
-            for a in out_arcs:
-                if arcs[a].arc_type=='nk_ar':
-                    active_paths.append(a)
+    return schema.map_finding(propagation_scheme, arcs, out_arcs, counter)
 
-    if counter==2:
-        if propagation_scheme[2]==1:
-            for a in out_arcs:
-                if arcs[a].arc_type=='sk_sk_minus_one':
-                    active_paths.append(a)
 
-        if propagation_scheme[3]==1:
-            for a in out_arcs:
-                if arcs[a].arc_type=='ar_feature':
-                    active_paths.append(a)
+def map_finding_to_net_arcs(propagation_scheme, net, variable, counter, schema=None):
+    '''
+    Equivalent to 'map_finding_to_arcs' for a variable of a CausalNet, with
+    the out arcs of each type looked up in the net's out arc buckets
+    '''
+    if schema is None:
+        schema = DEFAULT_SCHEMA
 
-    return active_paths
+    return schema.map_finding_net(net, variable.index_position, propagation_scheme, counter)
 
 
 def propagate(variables, arcs, active_out_arcs):
@@ -92,13 +245,10 @@ def propagate(variables, arcs, active_out_arcs):
     Return activated child variables on the filtered set of out arcs
     '''
     activated_variables = []
-    print(active_out_arcs)
 
     for a in active_out_arcs:
-        print("arc: ", a)
         av = arcs[a].variable_indexes
         for v in av:
-            print("variable: ", v)
             activated_variables.append(variables[v])
 
     return activated_variables
@@ -111,8 +261,6 @@ def merge_index(scheme_index, activated_variables, selection_dict):
     scale, but that it is unique at that scale (i.e. appears either 0 times or
     appears once)
     '''
-    global array_pos
-
     if scheme_index==0:
         scale = 'scale_1'
         array_pos = 0
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Propagation schema module describing which arc types each position of a
+finding vector opens, and at which variable depth, as a table rather than as
+branches in 'map_finding_to_arcs'.
+
+The default schema is the one in 'get_context':
+    finding[0] -> nk_sk & nk_sk_plus_one out arcs, at depth 1
+    finding[1] -> nk_ar out arcs, at depth 1
+    finding[2] -> sk_sk_minus_one out arcs, at depth 2
+    finding[3] -> ar_feature out arcs, at depth 2
+
+Deeper hierarchies only need a longer table. Arc types are held as integer
+codes (ARC_TYPES), so with a CausalNet the out arcs of a variable for a type
+are a lookup in its out-arc buckets rather than a scan of string types.
+"""
+
+import numpy as np
+
+from causal_net import ARC_TYPES
+
+
+# (variable depth, arc types) for each position of a finding vector
+FINDING_ARC_TYPES = (
+    (1, ('nk_sk', 'nk_sk_plus_one')),
+    (1, ('nk_ar',)),
+    (2, ('sk_sk_minus_one',)),
+    (2, ('ar_feature',)),
+)
+
+
+class PropagationSchema(object):
+    '''
+    Class mapping (variable depth, finding position) to the arc type codes
+    that the finding value opens
+    '''
+
+    def __init__(self, finding_arc_types=FINDING_ARC_TYPES):
+        self.bit_depths = tuple(depth for depth, arc_types in finding_arc_types)
+        self.bit_arc_types = tuple(tuple(arc_types) for depth, arc_types in finding_arc_types)
+        self.bit_arc_codes = tuple(tuple(ARC_TYPES.index(t) for t in arc_types)
+                                   for arc_types in self.bit_arc_types)
+        self.depths = tuple(sorted(set(self.bit_depths)))
+        self._bits = dict((depth, tuple(b for b in range(len(self.bit_depths)) if self.bit_depths[b] == depth))
+                          for depth in self.depths)
+
+    def __len__(self):
+        return len(self.bit_depths)
+
+    def bits(self, depth):
+        ''' Return the finding positions that apply at a depth '''
+        return self._bits.get(depth, ())
+
+    def active_bits(self, depth, finding):
+        ''' Return the finding positions that apply at a depth and are set '''
+        return [b for b in self.bits(depth) if b < len(finding) and finding[b] == 1]
+
+    def arc_codes(self, depth, finding):
+        ''' Return the arc type codes opened by a finding at a depth '''
+        return [code for b in self.active_bits(depth, finding) for code in self.bit_arc_codes[b]]
+
+    def map_finding(self, finding, arcs, out_arcs, depth):
+        '''
+        Return the out arcs opened by a finding at a depth, from a list of out
+        arc positions and the arcs they index, in the order of
+        'map_finding_to_arcs': by finding position, then by out arc order
+        '''
+        active_paths = []
+
+        for b in self.active_bits(depth, finding):
+            arc_types = self.bit_arc_types[b]
+            active_paths.extend(a for a in out_arcs if arcs[a].arc_type in arc_types)
+
+        return active_paths
+
+    def map_finding_net(self, net, variable, finding, depth):
+        '''
+        Return the out arcs of a variable (index position) of a CausalNet
+        opened by a finding at a depth, in the same order as 'map_finding',
+        using the net's out arc buckets
+        '''
+        active_paths = []
+
+        for b in self.active_bits(depth, finding):
+            buckets = [net.get_out_arcs(variable, code) for code in self.bit_arc_codes[b]]
+            if len(buckets) == 1:
+                active_paths.extend(buckets[0].tolist())
+            else:
+                active_paths.extend(np.sort(np.concatenate(buckets)).tolist())
+
+        return active_paths
+
+
+DEFAULT_SCHEMA = PropagationSchema()
+
+
+# END
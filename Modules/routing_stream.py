@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming ingestion of routing results, for running the demo pipeline over
+a json-lines file (or any stream) of many routing results.
+
+Routing results are read one line at a time as a generator, and each route
+is walked once to extract its routing node ids, the nodes that bound its
+phase regions (origin, transfers, destination) and its journey context.
+'prefetch' reads ahead through a bounded queue on a background thread, so
+a slow consumer blocks the reader rather than letting results build up in
+memory. 'process_routing_results' feeds the extracted routes through the
+geometry lookup, subgraph, phase region and propagation stages. Routes
+whose bounding nodes have no coordinates are still yielded, with the ids of
+those nodes listed under 'missing_coordinates'.
+"""
+
+import json
+import queue
+import threading
+
+from causal_net import construct_columnar_net, feature_view_template, selection_features
+from journey_context import CONTEXT_RULES, context_matrices, node_context
+from phase_region import get_region_bboxes
+from sparse_propagation import propagate_context
+
+
+def read_routing_results(source):
+    '''
+    Yield routing results from a json-lines file path or an open text
+    stream, skipping blank lines
+    '''
+    if isinstance(source, str):
+        with open(source, 'r') as f:
+            for routing_result_data in read_routing_results(f):
+                yield routing_result_data
+        return
+
+    for line in source:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def extract_route(routing_result_data, rules=None, matrices=None):
+    '''
+    Walk the routing nodes of a routing result once and return a dictionary
+    of the route ids, the positions of the nodes that bound the phase
+    regions, and the journey context in the form returned by 'get_context'
+    '''
+    if rules is None:
+        rules = CONTEXT_RULES
+    p_matrices = context_matrices(matrices)
+
+    nodes = routing_result_data['result']['nk_routing_nodes']
+    route = []
+    # origin, transfers and destination, as in the demo
+    bounding_nodes = [0] if len(nodes) > 0 else []
+    journey_context = []
+
+    for i in range(len(nodes)):
+        node = nodes[i]
+        route.append(node['id'])
+        if node['type'] == 'transfer':
+            bounding_nodes.append(i)
+        entry = node_context(node, rules, p_matrices)
+        if entry is not None:
+            journey_context.append(entry)
+
+    if len(nodes) > 0:
+        bounding_nodes.append(len(nodes) - 1)
+
+    return {
+        'routing_result': routing_result_data,
+        'route': route,
+        'bounding_nodes': bounding_nodes,
+        'context': {'journey_context': journey_context}
+    }
+
+
+def prefetch(iterable, maxsize=8):
+    '''
+    Yield the items of an iterable, reading up to maxsize items ahead on a
+    background thread. Exceptions in the reader are raised in the consumer.
+    '''
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def put(item, error=None):
+        # wait for room unless the consumer has gone, so the thread never
+        # blocks on a full queue that will not be read again
+        while not stop.is_set():
+            try:
+                buffer.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except Exception as e:
+            put(done, e)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def phase_region_bboxes(routing_node_coords, route, bounding_nodes):
+    '''
+    Return the bounding box of the journey extent (phase zero), between the
+    first and last bounding nodes, and a list of the bounding box of each
+    phase region between consecutive bounding nodes, as used for
+    'phase_zero_spatial_query' and 'phase_region_spatial_query'. A box is
+    None if either of its bounding nodes has no coordinates.
+    '''
+    if len(bounding_nodes) < 2:
+        return None, []
+
+    endpoints = [routing_node_coords.get(route[i]) for i in bounding_nodes]
+    pairs = [(endpoints[n], endpoints[n + 1]) for n in range(len(endpoints) - 1)]
+    pairs.append((endpoints[0], endpoints[-1]))
+
+    bboxes = [None] * len(pairs)
+    known = [n for n in range(len(pairs)) if pairs[n][0] is not None and pairs[n][1] is not None]
+    if len(known) > 0:
+        regions = [[[pairs[n][0][0], pairs[n][0][1]], [pairs[n][1][0], pairs[n][1][1]]] for n in known]
+        vecs, e_dist, mid, vw = get_region_bboxes(regions)
+        for n, vw_n in zip(known, vw.tolist()):
+            bboxes[n] = vw_n
+
+    return bboxes[-1], bboxes[:-1]
+
+
+def process_routing_results(graph_object, source, maxsize=8, spatial_queries=True):
+    '''
+    Stream routing results from a json-lines source through the demo
+    pipeline against a graph object (geo_graph.Graph or
+    memory_graph.MemoryGraph), yielding a dictionary for each route with
+    its phase zero and phase region selections and feature selection, whose
+    features are the variables of the route's net that its views index. At
+    most maxsize routes are read ahead of the consumer.
+
+    The ids of bounding nodes without coordinates are listed under
+    'missing_coordinates', and the regions they bound have no bbox or
+    selection.
+    '''
+    for record in prefetch((extract_route(r) for r in read_routing_results(source)), maxsize):
+        route = record['route']
+        routing_node_coords = graph_object.get_wkt_many(route)
+        data = graph_object.return_subgraph_from_routing_result(route)
+
+        missing_coordinates = []
+        for i in record['bounding_nodes']:
+            if route[i] not in routing_node_coords and route[i] not in missing_coordinates:
+                missing_coordinates.append(route[i])
+
+        p_zero_vw, bboxes = phase_region_bboxes(routing_node_coords, route, record['bounding_nodes'])
+
+        phase_zero = {'bbox': p_zero_vw, 'selection': None}
+        if p_zero_vw is not None and spatial_queries:
+            phase_zero['selection'] = graph_object.phase_zero_spatial_query(p_zero_vw)
+
+        phase_regions = []
+        for vw in bboxes:
+            selection = graph_object.phase_region_spatial_query(vw) if vw is not None and spatial_queries else None
+            phase_regions.append({'bbox': vw, 'selection': selection})
+
+        net = construct_columnar_net(data)
+        feature_selection = feature_view_template()
+        feature_selection['features'] = selection_features(net.variables)
+
+        yield {
+            'route': route,
+            'context': record['context'],
+            'missing_coordinates': missing_coordinates,
+            'phase_zero': phase_zero,
+            'phase_regions': phase_regions,
+            'feature_selection': propagate_context(net, record['context'], feature_selection)
+        }
+
+
+# END
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorised alternative to the recursive propagation in 'propagation'.
+
+Activation follows the net's compressed columns: out_offsets maps each
+(variable, arc type) to its out arcs, and arc_offsets maps each arc to the
+variables it activates (its variable_indexes). A finding vector is a set of
+arc-type masks, one set per variable depth, and at each depth the active
+(row, variable) pairs of the frontier are expanded through both offset
+arrays, so the work is proportional to the arcs actually followed.
+
+Rows of the activation block are the distinct (conceptual scale, finding)
+pairs in the journey context, so activation for all NK seeds and all five
+scales is one expansion per depth. The result is the same set of
+variables per scale and feature type as 'variable_activation', with the
+index lists in ascending order.
+
+'journey_activation' runs a batch of journeys over one net as one block, with
+a row for each (journey, scale, finding); see 'batch_propagation'.
+"""
+
+import numpy as np
+
+from causal_net import ARC_TYPES, VARIABLE_TYPES, feature_view_template, gather_ranges
+from propagation_schema import DEFAULT_SCHEMA
+from view_space import NUM_SCALES, VIEW_KEYS, ViewSpace
+
+
+class SparsePropagator(object):
+    '''
+    Class to run vectorised propagation over a CausalNet with a propagation
+    schema
+    '''
+    def __init__(self, net, schema=None):
+        self.net = net
+        self.schema = schema if schema is not None else DEFAULT_SCHEMA
+        self.num_variables = len(net.variable_types)
+        # only non-nk variables carry activation on past the first depth
+        self.expandable = net.variable_types != VARIABLE_TYPES.index('nk')
+
+    def activation_block(self, seeds, findings):
+        '''
+        Run propagation for a block of rows, where seeds is an (R, V) boolean
+        array of seed variables and findings an (R, n) array of the finding
+        vector for each row. Returns an (R, V) boolean array of the variables
+        activated in each row.
+        '''
+        net = self.net
+        n_types = len(ARC_TYPES)
+        findings = np.asarray(findings)
+        reached = np.zeros(seeds.shape, dtype=bool)
+        frontier = seeds
+
+        for depth in self.schema.depths:
+            activated = np.zeros(seeds.shape, dtype=bool)
+            # active (row, variable) pairs of the frontier
+            rows, sources = np.nonzero(frontier)
+
+            for bit in self.schema.bits(depth):
+                if bit >= findings.shape[1] or len(rows) == 0:
+                    continue
+                on = findings[rows, bit] == 1
+                if not on.any():
+                    continue
+                bit_rows = rows[on]
+                bit_sources = sources[on].astype(np.int64) * n_types
+                for code in self.schema.bit_arc_codes[bit]:
+                    # out arcs of each active source with this arc type
+                    arc_positions, arc_owners = gather_ranges(net.out_offsets[bit_sources + code],
+                        net.out_offsets[bit_sources + code + 1])
+                    out_arcs = net.out_arcs[arc_positions]
+                    # variables activated by each of those arcs
+                    positions, owners = gather_ranges(net.arc_offsets[out_arcs], net.arc_offsets[out_arcs + 1])
+                    activated[bit_rows[arc_owners[owners]], net.arc_variables[positions]] = True
+
+            reached |= activated
+            frontier = activated & self.expandable
+
+        return reached
+
+    def journey_activation(self, journey_contexts):
+        '''
+        Return a (J, NUM_SCALES, V) boolean array of the variables activated at
+        each conceptual scale for each of a list of journey contexts, in the
+        form returned by 'get_context'. Journeys are run together as one
+        block, with a row for each distinct (journey, scale, finding).
+        '''
+        rows = {}
+        seed_rows = []
+
+        for j, journey_context in enumerate(journey_contexts):
+            for entry in journey_context['journey_context']:
+                seeds = self.net.variable_index.get(entry['id'], [])
+                if len(seeds) == 0:
+                    continue
+                p_matrix = entry['context_findings'][0]
+                for scale in range(NUM_SCALES):
+                    key = (j, scale, tuple(p_matrix[scale]))
+                    if key not in rows:
+                        rows[key] = len(rows)
+                    seed_rows.append((rows[key], seeds))
+
+        scale_masks = np.zeros((len(journey_contexts), NUM_SCALES, self.num_variables), dtype=bool)
+        if len(rows) == 0:
+            return scale_masks
+
+        keys = sorted(rows, key=rows.get)
+        seeds = np.zeros((len(keys), self.num_variables), dtype=bool)
+        for row, seed_variables in seed_rows:
+            seeds[row, seed_variables] = True
+        findings = np.array([finding for j, scale, finding in keys], dtype=np.uint8)
+
+        reached = self.activation_block(seeds, findings)
+        for row, (j, scale, finding) in enumerate(keys):
+            scale_masks[j, scale] |= reached[row]
+
+        return scale_masks
+
+    def scale_activation(self, journey_context):
+        '''
+        Return an (NUM_SCALES, V) boolean array of the variables activated at
+        each conceptual scale for a journey context
+        '''
+        return self.journey_activation([journey_context])[0]
+
+    def view_space(self, scale_masks):
+        ''' Return a ViewSpace from per-scale activation masks '''
+        return ViewSpace.from_scale_masks(scale_masks, self.net.variable_types)
+
+    def write_views(self, scale_masks, selection_dict):
+        '''
+        Merge per-scale activation masks into the views of a feature view
+        template, keeping each index unique per scale and feature type
+        '''
+        view_space = self.view_space(scale_masks)
+
+        for scale in range(NUM_SCALES):
+            scale_key = 'scale_' + str(scale + 1)
+            view = selection_dict['views'][scale][scale_key][0]
+            for view_key in VIEW_KEYS:
+                existing = view[view_key]
+                present = set(existing)
+                existing.extend(i for i in view_space.indexes(scale, view_key).tolist() if i not in present)
+
+        return selection_dict
+
+
+def propagate_context(net, journey_context, selection_dict=None, propagator=None):
+    '''
+    Run vectorised propagation for every NK in a journey context at all
+    conceptual scales, and return the feature selection with its views
+    filled in. A SparsePropagator can be passed in to reuse it across calls
+    on the same net.
+    '''
+    if selection_dict is None:
+        selection_dict = feature_view_template()
+    if propagator is None:
+        propagator = SparsePropagator(net)
+
+    scale_masks = propagator.scale_activation(journey_context)
+
+    return propagator.write_views(scale_masks, selection_dict)
+
+
+def propagate_view_space(net, journey_context, propagator=None):
+    '''
+    Run vectorised propagation for a journey context and return the views as
+    a ViewSpace
+    '''
+    if propagator is None:
+        propagator = SparsePropagator(net)
+
+    return propagator.view_space(propagator.scale_activation(journey_context))
+
+
+# END
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial index module for running bounding box and radius queries over point
+features in process, as an alternative to the RTREE from the neo4j spatial
+plugin (spatial.bbox, spatial.closest).
+
+Each feature label (VML_POINTS, BOROUGH_TEXT, OSM_POINTS...) is indexed as a
+separate layer, so the label filter is applied before the spatial search
+rather than after it. A layer is a uniform grid over a NumPy array of
+coordinates, with the points sorted by grid cell so that each row of cells in
+a query is one contiguous slice of the sorted points.
+
+Regions use the same form as the phase region functions, [[x_1, y_1],
+[x_2, y_2]], and as with spatial.bbox the corners do not need to be ordered.
+"""
+
+import numpy as np
+
+from causal_net import gather_ranges
+
+
+def region_bounds(regions):
+    '''
+    Return an (n, 4) array of [lon_min, lat_min, lon_max, lat_max] for an
+    array of regions of the form [[x_1, y_1],[x_2, y_2]]
+    '''
+    regions = np.asarray(regions, dtype=np.float64).reshape(-1, 2, 2)
+
+    return np.hstack((regions.min(axis=1), regions.max(axis=1)))
+
+
+def window_join(points, coords, distance):
+    '''
+    Return (point positions, coord positions) for every pair of a query point
+    and a coordinate within a square window of +/- distance around the point,
+    which is the search window that spatial.closest uses. The join is done in
+    one vectorised pass by sorting the coordinates on longitude.
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+    order = np.argsort(coords[:, 0], kind='stable')
+    sorted_lon = coords[order, 0]
+    starts = np.searchsorted(sorted_lon, points[:, 0] - distance, side='left')
+    ends = np.searchsorted(sorted_lon, points[:, 0] + distance, side='right')
+
+    candidates, point_positions = gather_ranges(starts, ends)
+    coord_positions = order[candidates]
+    # window bounds computed as in the expanded search envelope
+    lat = coords[coord_positions, 1]
+    inside = ((lat >= points[point_positions, 1] - distance) &
+              (lat <= points[point_positions, 1] + distance))
+
+    return point_positions[inside], coord_positions[inside]
+
+
+class GridIndex(object):
+    '''
+    Class for a uniform grid over an (n, 2) array of [lon, lat] coordinates.
+    Query results are positions in the original coordinate array.
+    '''
+
+    def __init__(self, coords, points_per_cell=4):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        n = len(self.coords)
+        cells = max(1, int(np.sqrt(n / float(points_per_cell))))
+        self._shape = (cells, cells)
+
+        if n == 0:
+            self._origin = np.zeros(2)
+            self._cell_size = np.ones(2)
+        else:
+            self._origin = self.coords.min(axis=0)
+            span = self.coords.max(axis=0) - self._origin
+            self._cell_size = np.where(span > 0, span / cells, 1.0)
+
+        cell = self._cell(self.coords)
+        key = cell[:, 1] * cells + cell[:, 0]
+        self._order = np.argsort(key, kind='stable')
+        self._sorted = self.coords[self._order]
+        self._offsets = np.zeros(cells * cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(key, minlength=cells * cells), out=self._offsets[1:])
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _cell(self, coords):
+        ''' Return the (column, row) grid cell of each coordinate, clipped to the grid '''
+        cell = np.floor((coords - self._origin) / self._cell_size).astype(np.int64)
+        return np.clip(cell, 0, np.array(self._shape) - 1)
+
+    def bbox_many(self, regions):
+        '''
+        Return a list with the positions of the points in each region's
+        bounding box, in ascending order. Boundaries are inclusive.
+        '''
+        bounds = region_bounds(regions)
+        n_regions = len(bounds)
+        if n_regions == 0:
+            return []
+        if len(self.coords) == 0:
+            return [np.zeros(0, dtype=np.int64) for r in range(n_regions)]
+
+        lower = self._cell(bounds[:, 0:2])
+        upper = self._cell(bounds[:, 2:4])
+
+        # one range of sorted points per (region, grid row)
+        n_rows = upper[:, 1] - lower[:, 1] + 1
+        row_region = np.repeat(np.arange(n_regions), n_rows)
+        row = np.arange(int(n_rows.sum())) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows) + lower[row_region, 1]
+        starts = self._offsets[row * self._shape[0] + lower[row_region, 0]]
+        ends = self._offsets[row * self._shape[0] + upper[row_region, 0] + 1]
+
+        candidates, owners = gather_ranges(starts, ends)
+        region = row_region[owners]
+        x = self._sorted[candidates, 0]
+        y = self._sorted[candidates, 1]
+        b = bounds[region]
+        inside = (x >= b[:, 0]) & (x <= b[:, 2]) & (y >= b[:, 1]) & (y <= b[:, 3])
+
+        region = region[inside]
+        positions = self._order[candidates[inside]]
+        order = np.lexsort((positions, region))
+        counts = np.bincount(region, minlength=n_regions)
+
+        return np.split(positions[order], np.cumsum(counts)[:-1])
+
+    def bbox(self, region):
+        ''' Return the positions of the points in a region's bounding box '''
+        lon_min, lon_max = sorted((region[0][0], region[1][0]))
+        lat_min, lat_max = sorted((region[0][1], region[1][1]))
+        if len(self.coords) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        lower, upper = self._cell(np.array([[lon_min, lat_min], [lon_max, lat_max]]))
+        columns = self._shape[0]
+
+        if lower[0] == 0 and upper[0] == columns - 1:
+            # whole rows of cells are one contiguous slice
+            candidates = np.arange(self._offsets[lower[1] * columns], self._offsets[(upper[1] + 1) * columns])
+        else:
+            candidates = np.concatenate([
+                np.arange(self._offsets[row * columns + lower[0]], self._offsets[row * columns + upper[0] + 1])
+                for row in range(lower[1], upper[1] + 1)])
+
+        x = self._sorted[candidates, 0]
+        y = self._sorted[candidates, 1]
+        inside = (x >= lon_min) & (x <= lon_max) & (y >= lat_min) & (y <= lat_max)
+
+        return np.sort(self._order[candidates[inside]])
+
+    def within_many(self, points, distance):
+        '''
+        Return a list with the positions of the points within a Euclidean
+        distance of each query point, nearest first
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        windows = np.stack((points - distance, points + distance), axis=1)
+        results = []
+
+        for point, positions in zip(points, self.bbox_many(windows)):
+            d = np.hypot(self.coords[positions, 0] - point[0], self.coords[positions, 1] - point[1])
+            keep = d <= distance
+            results.append(positions[keep][np.argsort(d[keep], kind='stable')])
+
+        return results
+
+    def within(self, point, distance):
+        ''' Return the positions of the points within a distance of a point, nearest first '''
+        return self.within_many([point], distance)[0]
+
+
+class SpatialIndex(object):
+    '''
+    Class for a set of grid indexes partitioned by feature label. Each layer
+    holds the feature ids alongside the grid over their coordinates.
+    '''
+
+    def __init__(self):
+        self._layers = {}
+        self._ids = {}
+
+    def add_layer(self, label, ids, coords):
+        ''' Index the features of a label from their ids and (n, 2) coordinates '''
+        self._ids[label] = list(ids)
+        self._layers[label] = GridIndex(coords)
+
+    def labels(self):
+        return list(self._layers)
+
+    def layer(self, label):
+        return self._layers[label]
+
+    def ids(self, label):
+        return self._ids[label]
+
+    def bbox(self, region, label):
+        ''' Return the layer positions of the features of a label in a region '''
+        return self._layers[label].bbox(region)
+
+    def bbox_many(self, regions, label):
+        ''' Return the layer positions of the features of a label in each region '''
+        return self._layers[label].bbox_many(regions)
+
+    def within(self, point, distance, label):
+        ''' Return the layer positions of the features of a label within a distance, nearest first '''
+        return self._layers[label].within(point, distance)
+
+    def within_many(self, points, distance, label):
+        ''' Return the layer positions of the features of a label within a distance of each point '''
+        return self._layers[label].within_many(points, distance)
+
+    def selection(self, label, positions):
+        '''
+        Return features at the given layer positions in the form returned by
+        the phase region spatial queries
+        '''
+        coords = self._layers[label].coords
+        ids = self._ids[label]
+        spatial_selection = []
+
+        for p in positions:
+            spatial_selection.append({
+                'type': label,
+                'id': ids[p],
+                'geometry': coords[p].tolist()
+            })
+
+        return spatial_selection
+
+
+# END
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+View space module holding the result of propagation as one boolean mask over
+the variable indexes of a net for each (conceptual scale, feature type),
+rather than the nested lists of 'feature_view_template'.
+
+Membership, union and counts are array operations, and the persistence of a
+feature across scales (the first and last scale it appears at) is a
+reduction over the scale axis. 'to_views' converts back to the 'views'
+layout of a feature selection, with the indexes in ascending order.
+"""
+
+import numpy as np
+
+from causal_net import VARIABLE_TYPES
+
+
+# variable types recorded in the views, and their keys, as in 'merge_index'
+VIEW_TYPES = (('sk', 'SK'), ('sk_plus_one', 'SK_PLUS_ONE'), ('sk_minus_one', 'SK_MINUS_ONE'),
+              ('feature', 'FEATURES'))
+VIEW_KEYS = tuple(view_key for variable_type, view_key in VIEW_TYPES)
+
+NUM_SCALES = 5
+
+
+class ViewSpace(object):
+    '''
+    Class for the views of a feature selection over a net of num_variables
+    variables, as a (scale, view type, variable) boolean array
+    '''
+
+    def __init__(self, num_variables, num_scales=NUM_SCALES):
+        self.masks = np.zeros((num_scales, len(VIEW_KEYS), num_variables), dtype=bool)
+
+    @property
+    def num_scales(self):
+        return self.masks.shape[0]
+
+    @property
+    def num_variables(self):
+        return self.masks.shape[2]
+
+    @classmethod
+    def from_scale_masks(cls, scale_masks, variable_types):
+        '''
+        Create a view space from a (scale, variable) array of activated
+        variables and the type code of each variable
+        '''
+        scale_masks = np.asarray(scale_masks, dtype=bool)
+        variable_types = np.asarray(variable_types)
+        view_space = cls(scale_masks.shape[1], scale_masks.shape[0])
+
+        for t, (variable_type, view_key) in enumerate(VIEW_TYPES):
+            type_mask = variable_types == VARIABLE_TYPES.index(variable_type)
+            view_space.masks[:, t, :] = scale_masks & type_mask
+
+        return view_space
+
+    @classmethod
+    def from_views(cls, views, num_variables):
+        ''' Create a view space from the 'views' of a feature selection '''
+        view_space = cls(num_variables, len(views))
+
+        for scale in range(len(views)):
+            view = views[scale]['scale_' + str(scale + 1)][0]
+            for t, view_key in enumerate(VIEW_KEYS):
+                view_space.masks[scale, t, view[view_key]] = True
+
+        return view_space
+
+    def add(self, scale, view_key, indexes):
+        ''' Set variable indexes as present for a view type at a scale '''
+        self.masks[scale, VIEW_KEYS.index(view_key), indexes] = True
+
+    def contains(self, scale, view_key, index):
+        return bool(self.masks[scale, VIEW_KEYS.index(view_key), index])
+
+    def update(self, other):
+        ''' Add the views of another view space over the same net, in place '''
+        self.masks |= other.masks
+        return self
+
+    def union(self, other):
+        ''' Return a new view space with the views of both '''
+        view_space = ViewSpace(self.num_variables, self.num_scales)
+        np.logical_or(self.masks, other.masks, out=view_space.masks)
+        return view_space
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __eq__(self, other):
+        return isinstance(other, ViewSpace) and np.array_equal(self.masks, other.masks)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def counts(self):
+        ''' Return a (scale, view type) array of the number of indexes in each view '''
+        return self.masks.sum(axis=2)
+
+    def count(self, scale, view_key=None):
+        ''' Return the number of indexes at a scale, for one view type or all of them '''
+        if view_key is None:
+            return int(self.masks[scale].sum())
+        return int(self.masks[scale, VIEW_KEYS.index(view_key)].sum())
+
+    def indexes(self, scale, view_key):
+        ''' Return the indexes in a view, in ascending order '''
+        return np.nonzero(self.masks[scale, VIEW_KEYS.index(view_key)])[0]
+
+    def present(self):
+        ''' Return a (scale, variable) array of the variables present at each scale '''
+        return self.masks.any(axis=1)
+
+    def first_scale(self):
+        '''
+        Return the first scale (0 based) that each variable appears at, or -1
+        for variables that are not in the views
+        '''
+        present = self.present()
+        return np.where(present.any(axis=0), present.argmax(axis=0), -1)
+
+    def last_scale(self):
+        '''
+        Return the last scale (0 based) that each variable appears at, or -1
+        for variables that are not in the views
+        '''
+        present = self.present()
+        last = self.num_scales - 1 - present[::-1].argmax(axis=0)
+        return np.where(present.any(axis=0), last, -1)
+
+    def scales(self, index):
+        ''' Return the scales (0 based) that a variable appears at '''
+        return np.nonzero(self.present()[:, index])[0].tolist()
+
+    def to_views(self):
+        ''' Return the views in the layout of 'feature_view_template' '''
+        views = []
+
+        for scale in range(self.num_scales):
+            view = dict((view_key, self.indexes(scale, view_key).tolist()) for view_key in VIEW_KEYS)
+            views.append({'scale_' + str(scale + 1): [view, {}, {}, {}]})
+
+        return views
+
+
+# END
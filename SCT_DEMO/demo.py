@@ -15,8 +15,10 @@ import json
 from geo_graph import Graph, get_coords
 from journey_context import get_context
 from phase_region import get_vectors_from_wkt, sqr, euclidean_distance, midpoint, get_region_bbox
-from causal_net import Variable, Arc, construct_variables, construct_arcs, feature_view_template
-from propagation import variable_activation, map_finding_to_arcs, propagate, merge_index
+from causal_net import Variable, Arc, construct_variables, construct_arcs, construct_net, construct_columnar_net, feature_view_template
+from propagation import variable_activation, context_activation, map_finding_to_arcs, propagate, merge_index, TraceRecorder
+from sparse_propagation import propagate_context
+from routing_stream import process_routing_results
 
 #change to the username and password you have set for your db instance
 graph_object = Graph("bolt://localhost:7687", "username", "password")
@@ -32,23 +34,22 @@ Code to setup the graph
 # # ONLY TO BE RUN ONCE
 # graph_object.load_data_from_csv()
 #
-# # ONLY TO BE RUN ONCE
-# geometry_reference = []
+# # or, for larger extracts, load in batches that resume if interrupted
+# graph_object.load_data_from_csv_chunked('/Applications/neo4j-community-3.5.6/import', batch_size=10000, progress_path='csv_load_progress.json')
 #
+# # ONLY TO BE RUN ONCE
+# # rows in the reference file are (wkt, id), written in batches of 5000
 # with open('/Applications/neo4j-community-3.5.6/import/wkt_ref_test_6.csv','r') as f:
 #     reader = csv.reader(f, delimiter=',')
-#     reader = list(reader)
-#
-#     for row in range(len(reader)):
-#         id = reader[row][0]
-#         wkt_string = reader[row][1]
-#         wkt_feature = [id, wkt_string]
-#         geometry_reference.append(wkt_feature)
-#         graph_object.set_geometry(geometry_reference, row)
+#     geometry_pairs = ((row[1], row[0]) for row in reader)
+#     graph_object.set_geometry_batched(geometry_pairs, labels=('NK',), batch_size=5000)
 #
 # # ONLY TO BE RUN ONCE
 # graph_object.add_nodes_to_spatial_layer()
 #
+# # or, for larger extracts, index in batches that resume if interrupted
+# graph_object.add_nodes_to_spatial_layer_chunked(batch_size=10000)
+#
 # # ONLY TO BE RUN ONCE
 #
 # #create action region subgraphs
@@ -60,6 +61,10 @@ Code to setup the graph
 #     for edge_object in action_region_target_features['ar_feature_edge_list']:
 #         #pass in source ID and target ID to the write transaction
 #         graph_object.create_action_region_subgraphs(edge_object['ar_source_id'], edge_object['feature_target_id'])
+#
+# # or, as one in-process join over all action regions with batched writes
+# action_region_target_features = graph_object.action_region_feature_join(0.0002)
+# graph_object.create_action_region_subgraphs_batched(action_region_target_features, batch_size=5000)
 
 
 
@@ -72,6 +77,11 @@ with open('/Users/lucasgodfrey/Documents/GitHub/Automated-Map-Content-Selection-
         routing_result_data=json.loads(line)
 # print(routing_result_data)
 
+# or, to run every routing result in the file through the pipeline as a
+# stream, with a bounded read-ahead:
+# for journey in process_routing_results(graph_object, 'routing_result_v3.min.json', maxsize=8):
+#     print(journey['route'][0], len(journey['phase_regions']), "phase regions")
+
 # create an array to store the routing result
 routing_result_array = []
 
@@ -80,14 +90,14 @@ for nested_data in routing_result_data['result']['nk_routing_nodes']:
     id = nested_data['id']
     routing_result_array.append(id)
 
-# query the graph, matching on ID to get the WKT strings for each node in the result
+# query the graph once, matching on all IDs to get the coordinates for each
+# node in the result
+routing_node_coords = graph_object.get_wkt_many(routing_result_array)
+
 for traversed_node in routing_result_data['result']['nk_routing_nodes']:
-#   get the id and pass as argument to a query on the graph
-    id = traversed_node['id']
-#   match on the ID and return the wkt property
-    wkt_geometry = graph_object.get_wkt(id)
-#   change the geometry property to the wkt string
-    traversed_node['geometry'] = wkt_geometry
+#   change the geometry property to the parsed [lon, lat] coordinates, or None
+#   if the node has no geometry (only the phase region bounding nodes need it)
+    traversed_node['geometry'] = routing_node_coords.get(traversed_node['id'])
 
 # print result:
 # print(routing_result_data)
@@ -120,6 +130,11 @@ y = len(routing_result_data['result']['nk_routing_nodes'])
 y = y - 1
 phase_region_bounding_routing_nodes.append(routing_result_data['result']['nk_routing_nodes'][y])
 
+# the phase region queries need the coordinates of every bounding node
+missing_coordinates = [r['id'] for r in phase_region_bounding_routing_nodes if r['geometry'] is None]
+if len(missing_coordinates) > 0:
+    raise ValueError('no geometry for phase region bounding nodes: {}'.format(missing_coordinates))
+
 phase_regions = []
 
 for n in range(len(phase_region_bounding_routing_nodes)-1):
@@ -141,8 +156,8 @@ num_of_regions = len(phase_regions)
 #...low detail feature type
 reference_num = num_of_regions - 1
 # 'p_0' -> phase 0, i.e. the current journey extent
-p_zero_vec_one = get_coords(phase_regions[0][0]['geometry'])
-p_zero_vec_two = get_coords(phase_regions[reference_num][1]['geometry'])
+p_zero_vec_one = phase_regions[0][0]['geometry']
+p_zero_vec_two = phase_regions[reference_num][1]['geometry']
 p_zero_g_matrix = [[p_zero_vec_one[0], p_zero_vec_one[1]], [p_zero_vec_two[0], p_zero_vec_two[1]]]
 
 p_zero_vecs = get_vectors_from_wkt(p_zero_g_matrix)
@@ -159,8 +174,8 @@ print("phase region 0:",count_of_p_zero_features,"features")
 
 # now run spatial search for the rest of the phase regions
 for r in range(num_of_regions):
-    vec_one = get_coords(phase_regions[r][0]['geometry'])
-    vec_two = get_coords(phase_regions[r][1]['geometry'])
+    vec_one = phase_regions[r][0]['geometry']
+    vec_two = phase_regions[r][1]['geometry']
     g_matrix = [[vec_one[0], vec_one[1]],[vec_two[0], vec_two[1]]]
 
     vecs = get_vectors_from_wkt(g_matrix)
@@ -195,20 +210,15 @@ context = get_context(routing_result_data)
 ''' Construct a CN '''
 feature_selection = feature_view_template()
 
-arcs = construct_arcs(data)
-variables = construct_variables(data)
+# construct the variables and arcs, and get vertex indexes and out arcs
+net = construct_net(data)
+arcs = net.arcs
+variables = net.variables
 
 print("arcs: ", len(arcs))
 print("variables: " , len(variables))
 
-# get vertex indexes
-for i in range(len(arcs)):
-    arcs[i].get_parent_index(variables)
-    arcs[i].get_child_index(variables)
-
 for v in variables:
-    v.get_out_arcs(arcs)
-
     if v.variable_type!='feature':
         v_id = v.vertex_object['id']
         v_type = v.variable_type
@@ -230,13 +240,19 @@ for v in variables:
 
 ''' Run propagation over the CN '''
 
-for s in range(len(context['journey_context'])):
-    comp_id = context['journey_context'][s]['id']
-    for nk in variables:
-        if nk.get_id()==comp_id:
-            for conceptual_scale in range(0, 5):
-                p_matrix = context['journey_context'][s]['context_findings'][0][conceptual_scale]
-                variable_activation(nk, variables, arcs, conceptual_scale, p_matrix, feature_selection, 1)
+# run variable_activation from every NK in the journey context at each
+# conceptual scale
+feature_selection = context_activation(net, context, feature_selection)
+
+# to debug propagation, record the activations and write them to json lines:
+# trace = TraceRecorder()
+# feature_selection = context_activation(net, context, feature_selection, trace=trace)
+# trace.export('propagation_trace.jsonl')
+
+# or, with the vectorised engine over a columnar net (same views, with the
+# indexes in ascending order):
+# net = construct_columnar_net(data)
+# feature_selection = propagate_context(net, context, feature_selection)
 
 #print result:
 # print(json.dumps(feature_selection['features']))
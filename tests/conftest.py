@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+The modules are imported by name, as in the demo, so put Modules/ on the path.
+
+The 'memory_graph' fixture is a small synthetic extract of the demo csv data,
+with ids that are unique across labels, loaded into a MemoryGraph, and
+'routing_results' is a list of random routing results over its NK nodes.
+"""
+
+import csv
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Modules'))
+
+from graph_data import EDGE_FILES, FEATURE_FILES
+from journey_context import CONTEXT_RULES
+from memory_graph import MemoryGraph
+
+
+NUM_NK = 30
+
+# first id and count of the vertices of each network label
+NETWORK_IDS = {'NK': (1, NUM_NK), 'SK': (101, 40), 'AR': (301, 30),
+               'SK_PLUS_ONE': (201, 20), 'SK_MINUS_ONE': (401, 50)}
+
+
+def write_graph_data(data_dir, seed=0):
+    '''
+    Write a synthetic set of demo csv files and a routing node geometry
+    reference to data_dir, and return the (ar id, feature id) pairs for the
+    action region edges
+    '''
+    r = random.Random(seed)
+
+    def ids(label):
+        first, count = NETWORK_IDS[label]
+        return range(first, first + count)
+
+    def point():
+        return 'POINT (' + str(round(r.uniform(-0.2, 0.0), 6)) + ' ' + str(round(r.uniform(51.4, 51.6), 6)) + ')'
+
+    edge_id = 0
+    for file_name, parent_label, child_label, rel_type in EDGE_FILES:
+        with open(os.path.join(data_dir, file_name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['edge_id', 'parent', 'child'])
+            for parent in ids(parent_label):
+                for child in r.sample(list(ids(child_label)), 2):
+                    edge_id += 1
+                    writer.writerow([edge_id, parent, child])
+
+    feature_ids = []
+    for file_name, label in FEATURE_FILES:
+        with open(os.path.join(data_dir, file_name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            for n in range(20):
+                feature_ids.append(label.lower() + '_' + str(n))
+                writer.writerow([point(), feature_ids[-1]])
+
+    with open(os.path.join(data_dir, 'wkt_ref.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        for id in ids('NK'):
+            writer.writerow([point(), id])
+
+    return [(ar, feature_id) for ar in ids('AR') for feature_id in r.sample(feature_ids, 3)]
+
+
+def random_routing_result(r, num_nodes=10):
+    '''
+    Return a routing result of random routing nodes, using the (type, active)
+    pairs in CONTEXT_RULES
+    '''
+    rules = sorted(CONTEXT_RULES)
+    nodes = []
+
+    for i in range(num_nodes):
+        node_type, active = r.choice(rules)
+        nodes.append({'id': r.randint(1, NUM_NK), 'type': node_type, 'active': active})
+
+    return {'result': {'nk_routing_nodes': nodes}}
+
+
+@pytest.fixture(scope='session')
+def memory_graph(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp('graph_data'))
+    action_region_edges = write_graph_data(data_dir)
+
+    return MemoryGraph(data_dir, os.path.join(data_dir, 'wkt_ref.csv'), action_region_edges)
+
+
+@pytest.fixture(scope='session')
+def routing_results():
+    r = random.Random(1)
+
+    return [random_routing_result(r) for n in range(12)]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from activation_cache import ActivationCache
+from batch_propagation import batch_feature_selections
+from causal_net import construct_columnar_net, feature_view_template, selection_features
+from journey_context import get_context
+from propagation import context_activation
+
+
+def separate_selection(memory_graph, routing_result_data):
+    route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+    net = construct_columnar_net(memory_graph.return_subgraph_from_routing_result(route))
+    feature_selection = feature_view_template()
+    feature_selection['features'] = selection_features(net.variables)
+
+    return context_activation(net, get_context(routing_result_data), feature_selection)
+
+
+def test_second_journey_hits(memory_graph, routing_results):
+    # the same routing result twice in a batch: every lookup made for the
+    # second journey was made for the first
+    cache = ActivationCache()
+    batch_feature_selections(memory_graph, routing_results[:1], cache)
+    first = cache.stats()
+    assert first['misses'] > 0
+
+    cache = ActivationCache()
+    selections = batch_feature_selections(memory_graph, routing_results[:1] * 2, cache)
+    second = cache.stats()
+    assert second['misses'] == first['misses']
+    assert second['hits'] == 2 * first['hits'] + first['misses']
+    assert selections[0] == selections[1]
+
+
+def test_shared_seeds_hit_across_journeys(memory_graph, routing_results):
+    contexts = [get_context(routing_result_data) for routing_result_data in routing_results]
+    seen = set()
+    shared = 0
+    for journey_context in contexts:
+        ids = set(entry['id'] for entry in journey_context['journey_context'])
+        shared += len(ids & seen)
+        seen |= ids
+    assert shared > 0
+
+    # hits from journeys run one batch at a time
+    separate_hits = 0
+    for routing_result_data in routing_results:
+        cache = ActivationCache()
+        batch_feature_selections(memory_graph, [routing_result_data], cache)
+        separate_hits += cache.hits
+
+    cache = ActivationCache()
+    selections = batch_feature_selections(memory_graph, routing_results, cache)
+    assert cache.hits > separate_hits
+
+    for routing_result_data, feature_selection in zip(routing_results, selections):
+        assert feature_selection == separate_selection(memory_graph, routing_result_data)
+
+
+def test_rebind_clears(memory_graph, routing_results):
+    cache = ActivationCache()
+    batch_feature_selections(memory_graph, routing_results[:2], cache)
+    assert len(cache) > 0
+
+    cache.bind(construct_columnar_net(memory_graph.return_subgraph_from_routing_result([1])))
+    assert len(cache) == 0
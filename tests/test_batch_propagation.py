@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from activation_cache import ActivationCache
+from batch_propagation import batch_feature_selections
+from causal_net import construct_columnar_net, feature_view_template, selection_features
+from geo_graph import subgraph_template
+from journey_context import get_context
+from sparse_propagation import propagate_context
+
+
+class SubgraphSource(object):
+    '''
+    Graph object serving a fixed subgraph for each route
+    '''
+    def __init__(self, subgraphs):
+        self.subgraphs = subgraphs
+
+    def return_subgraph_from_routing_result(self, route):
+        return self.subgraphs[tuple(route)]
+
+
+def colliding_subgraphs():
+    # journey A has NK 1 -> SK 7, journey B has NK 2 -> AR 7 -> feature
+    a = subgraph_template()
+    a['vertices']['NK'].append({'id': 1})
+    a['vertices']['SK'].append({'id': 7})
+    a['edges']['NK_SK_BOUNDS'].append({'edge_id': 1, 'parent': 1, 'child': 7})
+
+    b = subgraph_template()
+    b['vertices']['NK'].append({'id': 2})
+    b['vertices']['AR'].append({'id': 7})
+    b['vertices']['FEATURES'].append({'id': 'f1', 'geometry': [-0.1, 51.5], 'type': 'VML_POINTS'})
+    b['edges']['NK_AR_ACTIVATES'].append({'edge_id': 1, 'parent': 2, 'child': 7})
+    b['edges']['CONTAINS_FEATURE'].append({'edge_id': 2, 'parent': 7, 'child': 'f1'})
+
+    return {(1,): a, (2,): b}
+
+
+def routing_result(id):
+    return {'result': {'nk_routing_nodes': [{'id': id, 'type': 'bus', 'active': 'transfer'}]}}
+
+
+def separate_selection(data, routing_result_data):
+    net = construct_columnar_net(data)
+    feature_selection = feature_view_template()
+    feature_selection['features'] = selection_features(net.variables)
+
+    return propagate_context(net, get_context(routing_result_data), feature_selection)
+
+
+@pytest.mark.parametrize('cache', [None, ActivationCache()])
+def test_colliding_ids_match_separate_runs(cache):
+    subgraphs = colliding_subgraphs()
+    routing_results = [routing_result(1), routing_result(2)]
+
+    selections = batch_feature_selections(SubgraphSource(subgraphs), routing_results, cache)
+
+    for routing_result_data, feature_selection in zip(routing_results, selections):
+        data = subgraphs[(routing_result_data['result']['nk_routing_nodes'][0]['id'],)]
+        assert feature_selection == separate_selection(data, routing_result_data)
+
+    # B does not pick up A's SK 7
+    for scale in range(5):
+        assert selections[1]['views'][scale]['scale_' + str(scale + 1)][0]['SK'] == []
+    assert selections[1]['views'][2]['scale_3'][0]['FEATURES'] == [2]
+    assert [f['id'] for f in selections[1]['features']] == [2, 7, 'f1']
+
+
+def test_selection_does_not_depend_on_batch(memory_graph, routing_results):
+    together = batch_feature_selections(memory_graph, routing_results)
+
+    for routing_result_data, feature_selection in zip(routing_results, together):
+        assert batch_feature_selections(memory_graph, [routing_result_data])[0] == feature_selection
+        route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+        data = memory_graph.return_subgraph_from_routing_result(route)
+        assert feature_selection == separate_selection(data, routing_result_data)
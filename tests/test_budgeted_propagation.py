@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from budgeted_propagation import budgeted_propagation
+from causal_net import construct_columnar_net
+from journey_context import get_context
+from view_space import NUM_SCALES, VIEW_KEYS
+
+
+def net_and_context(memory_graph, routing_result_data):
+    route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+    net = construct_columnar_net(memory_graph.return_subgraph_from_routing_result(route))
+
+    return net, get_context(routing_result_data)
+
+
+def views(selection_dict, scale):
+    return selection_dict['views'][scale]['scale_' + str(scale + 1)][0]
+
+
+def test_features_budget_keeps_prefix_and_stops_early(memory_graph, routing_results):
+    for routing_result_data in routing_results:
+        net, context = net_and_context(memory_graph, routing_result_data)
+        unbounded, unbounded_report = budgeted_propagation(net, context, None)
+        selection_dict, report = budgeted_propagation(net, context, {'FEATURES': 2})
+
+        for scale in range(NUM_SCALES):
+            scale_key = 'scale_' + str(scale + 1)
+            for view_key in VIEW_KEYS:
+                expected = views(unbounded, scale)[view_key]
+                if view_key == 'FEATURES':
+                    expected = expected[:2]
+                assert views(selection_dict, scale)[view_key] == expected
+
+            # features past the cap are not reached once the view is full
+            total = report[scale_key]['FEATURES']['kept'] + report[scale_key]['FEATURES']['dropped']
+            assert total <= unbounded_report[scale_key]['FEATURES']['kept']
+
+
+def test_features_budget_prunes_traversal(memory_graph, routing_results):
+    reached = 0
+    unbounded_reached = 0
+    for routing_result_data in routing_results:
+        net, context = net_and_context(memory_graph, routing_result_data)
+        unbounded_report = budgeted_propagation(net, context, None)[1]
+        report = budgeted_propagation(net, context, {'FEATURES': 1})[1]
+        for scale_key in report:
+            reached += report[scale_key]['FEATURES']['kept'] + report[scale_key]['FEATURES']['dropped']
+            unbounded_reached += unbounded_report[scale_key]['FEATURES']['kept']
+
+    assert reached < unbounded_reached
+
+
+def test_full_budget_skips_seeds(memory_graph, routing_results):
+    net, context = net_and_context(memory_graph, routing_results[0])
+    budget = dict((view_key, 1) for view_key in VIEW_KEYS)
+    selection_dict, report = budgeted_propagation(net, context, budget)
+
+    assert any(report[scale_key]['skipped_seeds'] > 0 for scale_key in report)
+    for scale in range(NUM_SCALES):
+        assert all(len(views(selection_dict, scale)[view_key]) <= 1 for view_key in VIEW_KEYS)
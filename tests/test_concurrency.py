@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import pytest
+
+from causal_net import construct_net, feature_view_template
+from journey_context import get_context
+from propagation import context_activation
+
+
+def journey(graph_object, routing_result_data):
+    '''
+    Run the demo pipeline for one routing result and return the routing node
+    coordinates and the views as json
+    '''
+    route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+    routing_node_coords = graph_object.get_wkt_many(route)
+    data = graph_object.return_subgraph_from_routing_result(route)
+    context = get_context(routing_result_data)
+
+    feature_selection = context_activation(construct_net(data), context, feature_view_template())
+
+    return json.dumps([routing_node_coords, feature_selection['views']], sort_keys=True)
+
+
+@pytest.mark.parametrize('threads', [2, 8])
+def test_concurrent_journeys_match_serial(memory_graph, routing_results, threads):
+    serial = [journey(memory_graph, routing_result_data) for routing_result_data in routing_results]
+    jobs = [j for r in range(4) for j in range(len(routing_results))]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outputs = list(pool.map(lambda j: journey(memory_graph, routing_results[j]), jobs))
+
+    assert [j for j, output in zip(jobs, outputs) if output != serial[j]] == []
+    assert any(json.loads(output)[1] != json.loads(serial[0])[1] for output in serial[1:])
+
+
+def test_no_output(memory_graph, routing_results, capsys):
+    journey(memory_graph, routing_results[0])
+
+    assert capsys.readouterr().out == ''
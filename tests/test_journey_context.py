@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from journey_context import context_array, context_from_array, get_context
+
+
+def test_node_without_active_is_left_out():
+    routing_result_data = {'result': {'nk_routing_nodes': [
+        {'id': 1, 'type': 'origin'},
+        {'id': 2, 'type': 'bus', 'active': 'transfer'},
+        {'id': 3, 'type': 'destination'}]}}
+
+    context = get_context(routing_result_data)
+    assert [entry['id'] for entry in context['journey_context']] == [2]
+
+    ids, findings = context_array(routing_result_data)
+    assert ids.tolist() == [2]
+    assert context_from_array(ids, findings) == context
+
+
+def test_context_array_matches_get_context(routing_results):
+    for routing_result_data in routing_results:
+        assert context_from_array(*context_array(routing_result_data)) == get_context(routing_result_data)
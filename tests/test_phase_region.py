@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from phase_region import (euclidean_distance, get_region_bbox, get_region_bboxes, get_vectors_from_wkt,
+    midpoint)
+
+
+def wgs84_regions(n=50, seed=25):
+    rng = np.random.RandomState(seed)
+    regions = np.round(rng.uniform([-0.5, 51.3], [0.3, 51.7], size=(n, 2, 2)), 4)
+    # regions with equal x values, in both lat orders, and a zero size region
+    regions[0] = [[-0.1, 51.5], [-0.1, 51.6]]
+    regions[1] = [[-0.1, 51.6], [-0.1, 51.5]]
+    regions[2] = [[0.2, 51.4], [0.2, 51.4]]
+    # values are strings, as read from wkt
+    return [[[str(x), str(y)] for x, y in region] for region in regions.tolist()]
+
+
+def test_region_bboxes_match_scalar_functions():
+    regions = wgs84_regions()
+    vecs, e_dist, mid, vw = get_region_bboxes(regions)
+
+    for i, region in enumerate(regions):
+        v, w = get_vectors_from_wkt(region)[0]
+        d = euclidean_distance(v, w)
+        m = midpoint(v, w)
+
+        assert vecs[i].tolist() == [v, w]
+        assert e_dist[i] == d
+        assert mid[i].tolist() == m
+        assert vw[i].tolist() == get_region_bbox(d, m)
+
+
+def test_equal_x_regions_are_swapped():
+    vecs = get_region_bboxes(wgs84_regions())[0]
+
+    assert vecs[0].tolist() == [[-0.1, 51.6], [-0.1, 51.5]]
+    assert vecs[1].tolist() == [[-0.1, 51.5], [-0.1, 51.6]]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from causal_net import construct_net, feature_view_template
+from journey_context import get_context
+from propagation import (context_activation, net_activation, net_activation_iterative,
+    variable_activation, variable_activation_iterative)
+
+
+def subgraph_and_context(memory_graph, routing_result_data):
+    route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+
+    return memory_graph.return_subgraph_from_routing_result(route), get_context(routing_result_data)
+
+
+def test_demo_call_matches_net_activation(memory_graph, routing_results):
+    for routing_result_data in routing_results:
+        data, context = subgraph_and_context(memory_graph, routing_result_data)
+        net = construct_net(data)
+        arcs = net.arcs
+        variables = net.variables
+
+        # the driver loop of the demo notebook
+        feature_selection = feature_view_template()
+        for s in range(len(context['journey_context'])):
+            comp_id = context['journey_context'][s]['id']
+            for nk_index in net.variable_index.get(comp_id, []):
+                nk = variables[nk_index]
+                for conceptual_scale in range(0, 5):
+                    p_matrix = context['journey_context'][s]['context_findings'][0][conceptual_scale]
+                    variable_activation(nk, variables, arcs, conceptual_scale, p_matrix, feature_selection, 1)
+
+        assert feature_selection['views'] == context_activation(net, context, feature_view_template())['views']
+
+
+def test_iterative_matches_recursive(memory_graph, routing_results):
+    # same views, including the order of the indexes, from both traversals
+    for routing_result_data in routing_results:
+        data, context = subgraph_and_context(memory_graph, routing_result_data)
+        net = construct_net(data)
+        recursive = feature_view_template()
+        iterative = feature_view_template()
+        net_recursive = feature_view_template()
+        net_iterative = feature_view_template()
+
+        for entry in context['journey_context']:
+            for nk_index in net.variable_index.get(entry['id'], []):
+                nk = net.variables[nk_index]
+                for conceptual_scale in range(0, 5):
+                    p_matrix = entry['context_findings'][0][conceptual_scale]
+                    variable_activation(nk, net.variables, net.arcs, conceptual_scale, p_matrix, recursive, 1)
+                    variable_activation_iterative(nk, net.variables, net.arcs, conceptual_scale, p_matrix,
+                        iterative, 1)
+                    net_activation(nk, net, conceptual_scale, p_matrix, net_recursive, 1)
+                    net_activation_iterative(nk, net, conceptual_scale, p_matrix, net_iterative, 1)
+
+        assert iterative['views'] == recursive['views']
+        assert net_recursive['views'] == recursive['views']
+        assert net_iterative['views'] == recursive['views']
+        assert any(len(indexes) > 0 for view in recursive['views'] for scale in view.values()
+            for indexes in scale[0].values())
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import threading
+import time
+
+from journey_context import get_context
+from routing_stream import extract_route, prefetch, process_routing_results
+
+
+def stream(routing_results):
+    return io.StringIO('\n'.join(json.dumps(routing_result_data) for routing_result_data in routing_results))
+
+
+def test_extract_route_context(routing_results):
+    for routing_result_data in routing_results:
+        assert extract_route(routing_result_data)['context'] == get_context(routing_result_data)
+
+
+def test_phase_zero_and_regions(memory_graph, routing_results):
+    for routing_result_data, record in zip(routing_results, process_routing_results(memory_graph, stream(routing_results))):
+        bounding_nodes = extract_route(routing_result_data)['bounding_nodes']
+        assert record['missing_coordinates'] == []
+        assert record['phase_zero']['selection'] == memory_graph.phase_zero_spatial_query(record['phase_zero']['bbox'])
+        assert len(record['phase_regions']) == len(bounding_nodes) - 1
+        assert all(region['bbox'] is not None for region in record['phase_regions'])
+
+        features = record['feature_selection']['features']
+        assert len(features) > 0
+        for view in record['feature_selection']['views']:
+            for indexes in list(view.values())[0][0].values():
+                assert all(0 <= i < len(features) for i in indexes)
+
+
+def test_missing_coordinates_recorded(memory_graph, routing_results):
+    # a destination node that is not in the graph
+    routing_result_data = json.loads(json.dumps(routing_results[0]))
+    nodes = routing_result_data['result']['nk_routing_nodes']
+    nodes.append({'id': -1, 'type': 'intersection', 'active': 'traverse'})
+
+    record = next(process_routing_results(memory_graph, stream([routing_result_data])))
+
+    assert record['missing_coordinates'] == [-1]
+    assert record['phase_zero'] == {'bbox': None, 'selection': None}
+    assert record['phase_regions'][-1] == {'bbox': None, 'selection': None}
+    assert all(region['bbox'] is not None for region in record['phase_regions'][:-1])
+
+
+def test_prefetch_reader_exits_when_closed():
+    threads = set(threading.enumerate())
+    items = prefetch(iter(range(2)), maxsize=1)
+    assert next(items) == 0
+    # the source is exhausted while the queue is full
+    time.sleep(0.3)
+    items.close()
+
+    for thread in set(threading.enumerate()) - threads:
+        thread.join(timeout=2)
+        assert not thread.is_alive()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from causal_net import construct_columnar_net, feature_view_template
+from journey_context import get_context
+from propagation import context_activation
+from sparse_propagation import SparsePropagator, propagate_context, propagate_view_space
+from view_space import NUM_SCALES, VIEW_KEYS
+
+
+def net_and_context(memory_graph, routing_result_data):
+    route = [node['id'] for node in routing_result_data['result']['nk_routing_nodes']]
+    net = construct_columnar_net(memory_graph.return_subgraph_from_routing_result(route))
+
+    return net, get_context(routing_result_data)
+
+
+def views(selection_dict, scale):
+    return selection_dict['views'][scale]['scale_' + str(scale + 1)][0]
+
+
+def test_views_match_context_activation(memory_graph, routing_results):
+    # the views hold the same indexes, in ascending rather than first reached order
+    propagated = 0
+    for routing_result_data in routing_results:
+        net, context = net_and_context(memory_graph, routing_result_data)
+        expected = context_activation(net, context, feature_view_template())
+        selection_dict = propagate_context(net, context)
+        view_space = propagate_view_space(net, context, SparsePropagator(net))
+
+        for scale in range(NUM_SCALES):
+            for view_key in VIEW_KEYS:
+                indexes = views(selection_dict, scale)[view_key]
+                assert indexes == sorted(views(expected, scale)[view_key])
+                assert view_space.indexes(scale, view_key).tolist() == indexes
+                propagated += len(indexes)
+
+    assert propagated > 0
+
+
+def test_journey_activation_matches_scale_activation(memory_graph, routing_results):
+    net, context = net_and_context(memory_graph, routing_results[0])
+    propagator = SparsePropagator(net)
+    contexts = [get_context(routing_result_data) for routing_result_data in routing_results]
+
+    for journey_context, scale_masks in zip(contexts, propagator.journey_activation(contexts)):
+        assert (scale_masks == propagator.scale_activation(journey_context)).all()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from spatial_index import GridIndex, window_join
+
+
+def grid_coords(n=400, seed=5):
+    # coordinates on a coarse lattice, so that points fall on region and cell boundaries
+    rng = np.random.RandomState(seed)
+    return np.round(rng.uniform([-0.5, 51.3], [0.3, 51.7], size=(n, 2)), 2)
+
+
+def random_regions(n=60, seed=6):
+    rng = np.random.RandomState(seed)
+    corners = np.round(rng.uniform([-0.7, 51.2], [0.5, 51.8], size=(n, 2, 2)), 2)
+    # regions given in either corner order, including one outside the grid
+    corners[0] = [[1.0, 52.0], [1.2, 52.1]]
+    return corners
+
+
+def brute_bbox(coords, region):
+    lon_min, lon_max = sorted((region[0][0], region[1][0]))
+    lat_min, lat_max = sorted((region[0][1], region[1][1]))
+    inside = ((coords[:, 0] >= lon_min) & (coords[:, 0] <= lon_max) &
+              (coords[:, 1] >= lat_min) & (coords[:, 1] <= lat_max))
+    return np.flatnonzero(inside)
+
+
+def test_bbox_matches_brute_force():
+    coords = grid_coords()
+    index = GridIndex(coords)
+    regions = random_regions()
+
+    many = index.bbox_many(regions)
+    assert len(many) == len(regions)
+    for region, positions in zip(regions, many):
+        expected = brute_bbox(coords, region)
+        assert np.array_equal(index.bbox(region), expected)
+        assert np.array_equal(positions, expected)
+
+
+def test_bbox_whole_grid_and_empty_index():
+    coords = grid_coords()
+    index = GridIndex(coords)
+    region = [[-1.0, 51.0], [1.0, 52.0]]
+    assert np.array_equal(index.bbox(region), np.arange(len(coords)))
+
+    empty = GridIndex(np.zeros((0, 2)))
+    assert len(empty.bbox(region)) == 0
+    assert [len(positions) for positions in empty.bbox_many([region, region])] == [0, 0]
+    assert empty.bbox_many([]) == []
+
+
+def test_within_many_matches_brute_force():
+    coords = grid_coords()
+    index = GridIndex(coords)
+    points = np.vstack((coords[:20], grid_coords(20, seed=7)))
+    distance = 0.05
+
+    for point, positions in zip(points, index.within_many(points, distance)):
+        d = np.hypot(coords[:, 0] - point[0], coords[:, 1] - point[1])
+        expected = np.flatnonzero(d <= distance)
+        expected = expected[np.argsort(d[expected], kind='stable')]
+        assert np.array_equal(positions, expected)
+        assert np.array_equal(index.within(point, distance), expected)
+
+
+def test_window_join_matches_brute_force():
+    coords = grid_coords()
+    points = np.vstack((coords[:10], grid_coords(30, seed=8), [[2.0, 53.0]]))
+    distance = 0.03
+
+    point_positions, coord_positions = window_join(points, coords, distance)
+    joined = set(zip(point_positions.tolist(), coord_positions.tolist()))
+    assert len(joined) == len(point_positions)
+
+    expected = set()
+    for i, point in enumerate(points):
+        # the window bounds of the search envelope, [point - distance, point + distance]
+        lower = point - distance
+        upper = point + distance
+        inside = np.all((coords >= lower) & (coords <= upper), axis=1)
+        expected.update((i, j) for j in np.flatnonzero(inside).tolist())
+    assert joined == expected
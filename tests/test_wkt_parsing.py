@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the batch wkt coordinate parser in geo_graph
+"""
+
+import pytest
+
+from geo_graph import get_coords, get_coords_array
+
+
+def test_matches_get_coords():
+    wkt_strings = ['POINT (1.5 2.5)', 'MULTIPOLYGON (((3 4, 5 6, 3 4)))', 'POINT Z (7 8 9)']
+
+    assert get_coords_array(wkt_strings).tolist() == [get_coords(w) for w in wkt_strings]
+
+
+def test_empty():
+    assert get_coords_array([]).shape == (0, 2)
+
+
+@pytest.mark.parametrize('wkt_strings', [
+    ['POINT Z (1 2 3)', 'POINT (4)'],
+    ['POINT (1 2)', 'POINT (a b)'],
+])
+def test_malformed_rows_raise(wkt_strings):
+    with pytest.raises((ValueError, IndexError)):
+        get_coords_array(wkt_strings)